@@ -0,0 +1,167 @@
+import asyncio
+import math
+import time
+from collections import deque
+
+from starlette.responses import JSONResponse
+
+import telemetry
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code, detail, retry_after):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+class AdmissionController:
+    """
+    Budgets concurrent work by resource cost, so a burst of uploads queues or is shed instead
+    of starting more browsers and model calls than the host can hold.
+
+    Each request asks for `cost` units out of `capacity`. Requests that don't fit wait in a
+    FIFO queue of at most `max_queue` entries for up to `queue_timeout` seconds. When the queue
+    is full the request is rejected at once with 429; when its wait runs out, with 503. Both
+    carry a Retry-After estimated from how long admitted requests have recently held their units.
+
+    Args:
+        capacity (int): Units available to requests running at once.
+        max_queue (int): Requests allowed to wait for units.
+        queue_timeout (float): Seconds a request may wait before it is rejected.
+    """
+
+    def __init__(self, capacity=80, max_queue=32, queue_timeout=30.0):
+        self.capacity = capacity
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._in_use = 0
+        self._running = 0
+        self._queue = deque()  # (cost, future) in arrival order
+        self._hold_seconds = 10.0  # moving average of how long admitted requests run
+        self.counters = {"admitted": 0, "queued": 0, "rejected_queue_full": 0, "rejected_timeout": 0}
+
+    async def acquire(self, cost):
+        """
+        Wait for `cost` units, raising AdmissionRejected if the request should be shed.
+
+        Returns:
+            float: Seconds spent queued.
+        """
+        cost = min(cost, self.capacity)
+        if not self._queue and self._in_use + cost <= self.capacity:
+            self._grant(cost)
+            return 0.0
+        if len(self._queue) >= self.max_queue:
+            self.counters["rejected_queue_full"] += 1
+            raise AdmissionRejected(429, "Server is busy, please try again shortly", self._retry_after())
+
+        self.counters["queued"] += 1
+        waiter = asyncio.get_running_loop().create_future()
+        entry = (cost, waiter)
+        self._queue.append(entry)
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._abandon(entry)
+            self.counters["rejected_timeout"] += 1
+            raise AdmissionRejected(503, "Timed out waiting for capacity, please try again", self._retry_after())
+        except asyncio.CancelledError:
+            self._abandon(entry)
+            raise
+        return time.perf_counter() - started
+
+    def release(self, cost, held_seconds):
+        cost = min(cost, self.capacity)
+        self._in_use -= cost
+        self._running -= 1
+        self._hold_seconds = 0.9 * self._hold_seconds + 0.1 * held_seconds
+        self._wake()
+
+    def stats(self):
+        return {
+            **self.counters,
+            "capacity": self.capacity,
+            "in_use": self._in_use,
+            "running": self._running,
+            "queue_depth": len(self._queue),
+            "hold_seconds_avg": round(self._hold_seconds, 3),
+        }
+
+    def _grant(self, cost):
+        self._in_use += cost
+        self._running += 1
+        self.counters["admitted"] += 1
+
+    def _wake(self):
+        # Strict FIFO: a large request at the head is not starved by smaller ones behind it
+        while self._queue and self._in_use + self._queue[0][0] <= self.capacity:
+            cost, waiter = self._queue.popleft()
+            if not waiter.done():
+                self._grant(cost)
+                waiter.set_result(None)
+
+    def _abandon(self, entry):
+        cost, waiter = entry
+        if waiter.done():
+            # Units were granted just as the wait ended; hand them back
+            self._in_use -= cost
+            self._running -= 1
+            self.counters["admitted"] -= 1
+            self._wake()
+            return
+        waiter.cancel()
+        try:
+            self._queue.remove(entry)
+        except ValueError:
+            pass
+        self._wake()
+
+    def _retry_after(self):
+        # Roughly when the queue ahead would drain at the current pace
+        running = max(self._running, 1)
+        return max(1, min(120, math.ceil(self._hold_seconds * (len(self._queue) + 1) / running)))
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware admitting requests to the routes in `costs` through an AdmissionController.
+
+    Units are held until the response, including a streamed body, has been sent, and rejected
+    requests get a JSON error with a Retry-After header before any work starts.
+    """
+
+    def __init__(self, app, controller, costs):
+        self.app = app
+        self.controller = controller
+        self.costs = costs
+
+    async def __call__(self, scope, receive, send):
+        cost = self.costs.get(scope["path"]) if scope["type"] == "http" else None
+        if not cost:
+            await self.app(scope, receive, send)
+            return
+
+        with telemetry.span("admission", cost=cost) as span:
+            try:
+                waited = await self.controller.acquire(cost)
+            except AdmissionRejected as e:
+                span.status = f"rejected_{e.status_code}"
+                rejected = e
+            else:
+                rejected = None
+                span.set(waited_ms=round(waited * 1000, 1))
+        if rejected is not None:
+            print(f"Rejected {scope['path']} with {rejected.status_code}: {rejected.detail}")
+            response = JSONResponse(
+                {"detail": rejected.detail},
+                status_code=rejected.status_code,
+                headers={"Retry-After": str(rejected.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(cost, time.perf_counter() - started)
@@ -1,13 +1,17 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Request, UploadFile, File
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from base64 import b64decode
 import google.generativeai as genai
 import google.generativeai.types as types
 import os
+import json
+import re
+import asyncio
+import time
+from typing import List, Optional
 from dotenv import load_dotenv
-from PIL import Image
-import io
+from contextlib import asynccontextmanager
 
 from fastapi import HTTPException, status
 
@@ -18,6 +22,12 @@ class ImageRequest(BaseModel):
     @property
     def get_image_bytes(self) -> bytes:
         """Convert base64 string to bytes, handling potential data URL prefix"""
+        # Reject oversized uploads before spending time decoding them
+        if estimated_base64_size(self.image) > MAX_UPLOAD_BYTES:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Image is larger than the {MAX_UPLOAD_BYTES} byte limit"
+            )
         try:
             # Check if the string contains the data URL prefix
             if ',' in self.image:
@@ -32,8 +42,21 @@ class ImageRequest(BaseModel):
                 detail=f"Invalid base64 image data: {str(e)}"
             )
 
+class BatchImageRequest(BaseModel):
+    images: List[str]  # base64 encoded photos of the same injury
+
+    @property
+    def get_images_bytes(self) -> List[bytes]:
+        if not self.images or len(self.images) > MAX_BATCH_IMAGES:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"Send between 1 and {MAX_BATCH_IMAGES} images"
+            )
+        return [ImageRequest(image=image).get_image_bytes for image in self.images]
+
 class ChatRequest(BaseModel):
     message: str
+    session_id: Optional[str] = None  # returned by /analyze; when set, context is ignored
     context: dict = {
         "description": "",
         "diagnosis": "",
@@ -45,10 +68,127 @@ class ChatRequest(BaseModel):
 # Import asynchronous functions
 import google_search
 import page_content_extractor
+import html_parsing
+import telemetry
+from admission import AdmissionController, AdmissionMiddleware, AdmissionRejected
+from job_store import DONE, FAILED, QUEUED, create_job_store
+from job_worker import JobWorkerPool
+from browser_pool import BrowserPool, BrowserPoolExhausted
+from page_cache import PageCache, normalize_url
+from search_cache import SearchCache, normalize_query
+from model_client import ModelClient
+from session_store import create_session_store
+from search_backends import create_search_backend
+from context_builder import build_context, select_passages
+from image_cache import ImageResultCache, fingerprint
+from image_preprocessing import ImageTooLarge, check_upload_size, estimated_base64_size, load_prepared, prepare_image
 
 load_dotenv(override=True)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Keep warm browsers around for google_search instead of launching Chrome per query
+    pool = BrowserPool(
+        browsers=int(os.environ.get("BROWSER_POOL_SIZE", 1)),
+        tabs_per_browser=int(os.environ.get("BROWSER_POOL_TABS", 3)),
+        max_uses=int(os.environ.get("BROWSER_POOL_MAX_USES", 100)),
+        acquire_timeout=float(os.environ.get("BROWSER_POOL_ACQUIRE_TIMEOUT", 15)),
+        max_waiters=int(os.environ.get("BROWSER_POOL_MAX_WAITERS", 20)),
+    )
+    search_cache = SearchCache(
+        max_entries=int(os.environ.get("SEARCH_CACHE_SIZE", 512)),
+        ttl=float(os.environ.get("SEARCH_CACHE_TTL", 6 * 3600)),
+    )
+    google_search.set_search_cache(search_cache)
+    try:
+        await pool.start()
+        google_search.set_browser_pool(pool)
+    except Exception as e:
+        print(f"Error starting browser pool, falling back to a browser per search: {e}")
+        await pool.close()
+        pool = None
+
+    engine = page_content_extractor.ExtractionEngine(
+        max_concurrency=int(os.environ.get("SCRAPE_MAX_CONCURRENCY", 10)),
+        per_host_concurrency=int(os.environ.get("SCRAPE_PER_HOST_CONCURRENCY", 2)),
+        driver_pool_size=int(os.environ.get("SCRAPE_DRIVER_POOL_SIZE", 2)),
+        cache=PageCache(
+            max_entries=int(os.environ.get("PAGE_CACHE_SIZE", 256)),
+            ttl=float(os.environ.get("PAGE_CACHE_TTL", 24 * 3600)),
+            db_path=os.environ.get("PAGE_CACHE_DB") or None,
+        ),
+    )
+    html_parsing.set_default_backend(os.environ.get("HTML_PARSER"))
+    page_content_extractor.set_engine(engine)
+
+    # Cache and pool counters are read on every /metrics scrape
+    telemetry.register_stats("search_cache", search_cache.stats)
+    telemetry.register_stats("page_cache", engine.cache.stats)
+    telemetry.register_stats("image_cache", image_cache.stats)
+    telemetry.register_stats("admission", admission.stats)
+    if pool:
+        telemetry.register_stats("browser_pool", pool.stats)
+    if hasattr(search_backend, "counters"):
+        telemetry.register_stats("search_backend", lambda: search_backend.counters)
+
+    global job_workers
+    if JOB_WORKERS > 0:
+        job_workers = JobWorkerPool(
+            job_store, run_analysis_job, concurrency=JOB_WORKERS,
+            stale_after=JOB_STALE_AFTER, max_attempts=JOB_MAX_ATTEMPTS,
+        )
+        job_workers.start()
+        telemetry.register_stats("job_workers", lambda: job_workers.counters)
+    telemetry.register_stats("jobs", lambda: {"queued": job_store.queued_count(), "queued_bytes": job_store.queued_bytes()})
+
+    cleanup = asyncio.create_task(expire_periodically())
+    yield
+    cleanup.cancel()
+    if job_workers is not None:
+        # Jobs cut short here go back to the queue for the next worker
+        await job_workers.close()
+        job_workers = None
+    for prefix in ("search_cache", "page_cache", "image_cache", "admission", "browser_pool", "search_backend",
+                   "jobs", "job_workers"):
+        telemetry.register_stats(prefix, None)
+    session_store.close()
+    job_store.close()
+    search_backend.close()
+    google_search.set_browser_pool(None)
+    google_search.set_search_cache(None)
+    if pool:
+        await pool.close()
+    page_content_extractor.set_engine(None)
+    await engine.close()
+
+app = FastAPI(lifespan=lifespan)
+
+# Concurrent requests are budgeted by cost so a burst queues or is shed instead of exhausting RAM.
+# An /analyze call holds browser tabs, page fetches and several model calls; a chat message one call.
+admission = AdmissionController(
+    capacity=int(os.environ.get("ADMISSION_CAPACITY", 80)),
+    max_queue=int(os.environ.get("ADMISSION_MAX_QUEUE", 32)),
+    queue_timeout=float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", 30)),
+)
+ANALYZE_COST = int(os.environ.get("ANALYZE_COST", 10))
+CHAT_COST = int(os.environ.get("CHAT_COST", 1))
+# A batch describes every photo but shares one search and scrape, so it costs little more than one analysis
+ANALYZE_BATCH_COST = int(os.environ.get("ANALYZE_BATCH_COST", 15))
+# Submitting a job only decodes and downsizes the photo; the job itself is admitted when it runs
+JOB_SUBMIT_COST = int(os.environ.get("JOB_SUBMIT_COST", 2))
+app.add_middleware(AdmissionMiddleware, controller=admission, costs={
+    "/analyze": ANALYZE_COST,
+    "/analyze/stream": ANALYZE_COST,
+    "/analyze/upload": ANALYZE_COST,
+    "/analyze/batch": ANALYZE_BATCH_COST,
+    "/analyze/batch/upload": ANALYZE_BATCH_COST,
+    "/jobs/analyze": JOB_SUBMIT_COST,
+    "/jobs/analyze/upload": JOB_SUBMIT_COST,
+    "/chat": CHAT_COST,
+    "/chat/stream": CHAT_COST,
+})
+# Added last so it wraps admission and also times rejected requests
+app.add_middleware(telemetry.TracingMiddleware)
 
 # Configure the Gemini API
 API_KEY = os.environ.get("GOOGLE_API_KEY")
@@ -66,119 +206,395 @@ generate_content_config = types.GenerationConfig(
 image_model = genai.GenerativeModel('gemini-2.0-pro-exp-02-05', generation_config=generate_content_config)
 which_pages_model = genai.GenerativeModel('gemini-2.0-flash-thinking-exp-01-21', generation_config=generate_content_config)
 
-@app.post("/analyze")
-async def analyze(request: ImageRequest):
-    # Step 1: Load image and get description from base64 data
+# All model calls go through this so they never block the event loop
+model_client = ModelClient(
+    max_concurrency=int(os.environ.get("MODEL_MAX_CONCURRENCY", 8)),
+    timeout=float(os.environ.get("MODEL_TIMEOUT", 60)),
+    max_retries=int(os.environ.get("MODEL_MAX_RETRIES", 3)),
+)
+
+# Analysis context and chat history, so /chat clients only send a session ID
+session_store = create_session_store(
+    backend=os.environ.get("SESSION_STORE", "memory"),
+    db_path=os.environ.get("SESSION_DB", "sessions.db"),
+    ttl=float(os.environ.get("SESSION_TTL", 2 * 3600)),
+    max_sessions=int(os.environ.get("SESSION_MAX", 10000)),
+)
+# Where search results come from: "browser" scrapes Google, "local" queries a prebuilt index of
+# curated pages and "tiered" consults the index first, falling back to Google for sparse results
+search_backend = create_search_backend(
+    backend=os.environ.get("SEARCH_BACKEND", "browser"),
+    index_path=os.environ.get("SEARCH_INDEX_DB", "search_index.db"),
+    min_local_results=int(os.environ.get("SEARCH_LOCAL_MIN_RESULTS", 5)),
+)
+# Uploaded photos are checked against these limits, then downsized and re-encoded before the model sees them
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 15 * 1024 * 1024))
+# Photos accepted by one /analyze/batch call
+MAX_BATCH_IMAGES = int(os.environ.get("MAX_BATCH_IMAGES", 6))
+IMAGE_OPTIONS = {
+    "max_side": int(os.environ.get("MAX_IMAGE_SIDE", 1536)),
+    "quality": int(os.environ.get("IMAGE_JPEG_QUALITY", 85)),
+    "max_bytes": MAX_UPLOAD_BYTES,
+    "max_pixels": int(os.environ.get("MAX_IMAGE_PIXELS", 50_000_000)),
+}
+# Results of earlier analyses, reused when the same or a nearly identical photo is uploaded again
+image_cache = ImageResultCache(
+    max_entries=int(os.environ.get("IMAGE_CACHE_SIZE", 1024)),
+    ttl=float(os.environ.get("IMAGE_CACHE_TTL", 24 * 3600)),
+    max_distance=int(os.environ.get("IMAGE_CACHE_MAX_DISTANCE", 6)),
+)
+# Queries searched concurrently per /analyze call; 1 keeps the sequential retry loop
+SPECULATIVE_SEARCH_QUERIES = int(os.environ.get("SPECULATIVE_SEARCH_QUERIES", 1))
+# Distinct results after which still-running speculative searches are cancelled
+SPECULATIVE_MIN_RESULTS = int(os.environ.get("SPECULATIVE_MIN_RESULTS", 15))
+# Top organic results of each search fetched speculatively while links are being selected
+PREFETCH_TOP_RESULTS = int(os.environ.get("PREFETCH_TOP_RESULTS", 3))
+# Seconds a page may take before the pipeline stops waiting for it
+PAGE_DEADLINE = float(os.environ.get("PAGE_DEADLINE", 15))
+# Diagnosis starts once this many pages, or this much text, have been extracted
+PAGE_QUORUM = int(os.environ.get("PAGE_QUORUM", 3))
+QUORUM_TEXT_CHARS = int(os.environ.get("QUORUM_TEXT_CHARS", 40000))
+# Estimated prompt tokens allowed for scraped page text in diagnosis and chat prompts
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", 6000))
+# Estimated tokens of page text kept in a chat session, ranked against the description and query;
+# chat prompts pick their CONTEXT_TOKEN_BUDGET from these passages rather than from whole pages
+SESSION_CONTEXT_TOKEN_BUDGET = int(os.environ.get("SESSION_CONTEXT_TOKEN_BUDGET", 4 * CONTEXT_TOKEN_BUDGET))
+# Chat exchanges kept per session besides the first one, which carries the analysis context
+MAX_CHAT_HISTORY_TURNS = int(os.environ.get("MAX_CHAT_HISTORY_TURNS", 10))
+# Background /jobs/analyze runs; the sqlite store lets job_worker.py processes share the queue
+JOB_STORE_BACKEND = os.environ.get("JOB_STORE", "memory")
+job_store = create_job_store(
+    backend=JOB_STORE_BACKEND,
+    db_path=os.environ.get("JOB_DB", "jobs.db"),
+    ttl=float(os.environ.get("JOB_TTL", 3600)),
+)
+# Jobs run at once by workers in this process; 0 leaves them to job_worker.py processes
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+# Submits beyond this many waiting jobs, or this many bytes of waiting images, are rejected
+JOB_MAX_QUEUED = int(os.environ.get("JOB_MAX_QUEUED", 1000))
+JOB_MAX_QUEUED_BYTES = int(os.environ.get("JOB_MAX_QUEUED_BYTES", 256 * 1024 * 1024))
+# Runs per job before it is failed, counting requeues after busy errors or a lost worker
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 3))
+# Seconds a running job may go without progress before it is handed to another worker
+JOB_STALE_AFTER = float(os.environ.get("JOB_STALE_AFTER", 300))
+# Started by the lifespan when JOB_WORKERS > 0
+job_workers = None
+
+async def expire_periodically(interval=600):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(session_store.delete_expired)
+            await asyncio.to_thread(job_store.delete_expired)
+        except Exception as e:
+            print(f"Error expiring sessions and jobs: {e}")
+
+async def load_image(image_data):
+    """Downsize and re-encode the uploaded image off the event loop, raising HTTPException if it is too large."""
     try:
-        print(f"Received request with image data length: {len(request.image)}")
-        image_data = request.get_image_bytes
-        print("Successfully decoded base64 data")
-        img = Image.open(io.BytesIO(image_data))
-        print(f"Successfully opened image: {img.format} {img.size}")
-    except HTTPException as e:
-        # Re-raise validation errors
-        raise e
+        with telemetry.span("image_decode", bytes=len(image_data)):
+            image = await prepare_image(image_data, **IMAGE_OPTIONS)
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    print(
+        f"Prepared image: {image.original_size} {image.original_bytes} bytes -> "
+        f"{image.image.size} {len(image.data)} bytes"
+    )
+    return image
+
+def search_busy_error(e):
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=f"Search is busy, please try again shortly: {e}",
+        headers={"Retry-After": "5"},
+    )
+
+def prefetch_top_results(prefetcher, search_results):
+    for result in search_results[:PREFETCH_TOP_RESULTS]:
+        prefetcher.start(result.get("link"))
+
+async def select_links(description, search_results):
+    """Ask the model which search results are worth reading, returning their links."""
+    # Enhanced prompt for page relevance evaluation
+    prompt_pages = (
+        "From the search results provided, carefully evaluate and select pages that would be "
+        "relevant enough to help diagnose and treat this injury, wound, or other treatable "
+        "condition. Consider medical authority, relevance to the specific condition, and "
+        "treatment information. Only return links that you are confident will be helpful. "
+        "Don't respond with anything except the links to the relevant pages.\n\n"
+        f"Description: {description}\nSearch Results: {search_results}"
+    )
+    with telemetry.span("select_links", results=len(search_results)) as span:
+        pages_links_text = await model_client.generate_text(which_pages_model, prompt_pages)
+        links = [line.strip() for line in pages_links_text.splitlines() if line.strip().startswith("http")]
+        span.set(links=len(links))
+    return links
+
+async def generate_search_queries(description, count):
+    """Ask the model for `count` diverse search queries in a single call, dropping near-duplicates."""
+    prompt_queries = (
+        f"Create {count} different search queries that would return helpful results for diagnosis and "
+        f"treatment from this description of an injury, wound, or other treatable condition. Focus on "
+        f"medical and healthcare resources. Make each query take a different approach, for example the "
+        f"likely condition, the visible symptoms, or first aid and treatment. Respond with one query per "
+        f"line and nothing else. Description: {description}"
+    )
+    with telemetry.span("generate_queries", count=count):
+        response = await model_client.generate_text(which_pages_model, prompt_queries)
+    queries = {}
+    for line in response.splitlines():
+        # Drop list markers the model sometimes adds ("1.", "-", "*")
+        query = re.sub(r"^\s*(?:[-*\u2022]|\d+[.)])\s*", "", line).strip().strip('"')
+        if query and normalize_query(query) not in queries:
+            queries[normalize_query(query)] = query
+    if not queries:
+        raise ValueError("Model returned no search queries")
+    return list(queries.values())[:count]
+
+async def speculative_search(description, queries, prefetcher=None):
+    """
+    Search every query concurrently, merge the results by URL and select links in a single pass.
+
+    Searches still running are cancelled once SPECULATIVE_MIN_RESULTS distinct results are in.
+    Top results of each search are handed to `prefetcher` as soon as that search finishes.
+
+    Returns:
+        tuple: (links, queries whose searches contributed results)
+    """
+    tasks = {
+        asyncio.ensure_future(telemetry.traced("search", search_backend.search(query), attempt=1, backend=search_backend.name)): query
+        for query in queries
+    }
+    pending = set(tasks)
+    merged = {}  # normalized URL -> result
+    used_queries = []
+    busy = None
+    failure = None
+    try:
+        while pending and len(merged) < SPECULATIVE_MIN_RESULTS:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                # One failed search must not cost the round the results of the others
+                try:
+                    results = task.result()
+                except BrowserPoolExhausted as e:
+                    busy = e
+                    continue
+                except Exception as e:
+                    print(f"Search for {tasks[task]!r} failed: {e}")
+                    failure = e
+                    continue
+                if results:
+                    used_queries.append(tasks[task])
+                if prefetcher is not None:
+                    prefetch_top_results(prefetcher, results)
+                for result in results:
+                    if not result.get("link"):
+                        continue
+                    try:
+                        key = normalize_url(result["link"])
+                    except ValueError:
+                        continue
+                    merged.setdefault(key, result)
+    finally:
+        for task in pending:
+            task.cancel()
+    if pending:
+        print(f"Cancelled {len(pending)} search(es) with {len(merged)} results already in")
+    if not merged and busy is not None:
+        raise search_busy_error(busy)
+    if not merged and failure is not None:
+        raise failure
+    if not merged:
+        return [], used_queries
+
+    links = await select_links(description, list(merged.values()))
+    print(f"Found {len(links)} relevant links from {len(merged)} merged results")
+    return links, used_queries
+
+async def analysis_events(image):
+    """
+    Run the analyze pipeline on a decoded image, yielding (event, data) pairs as each stage completes.
+
+    Events are "description", "search_query", "links", "page" (once per extracted page) and
+    "diagnosis", followed by exactly one terminal "result" (the full /analyze response) or
+    "error" event. HTTPException is raised when the request should be retried later.
+    """
+    # Reuse the analysis of an identical or near-identical photo
+    with telemetry.span("image_cache") as span:
+        exact_hash, perceptual_hash = await asyncio.to_thread(fingerprint, image)
+        cached, match = image_cache.get(exact_hash, perceptual_hash)
+        span.set(match=match or "miss")
+    if cached is not None:
+        print(f"Reusing cached analysis ({match} image match)")
+        async for event in cached_analysis_events(cached, match):
+            yield event
+        return
+
+    # Step 1: Get description of the image
+    try:
+        description = await describe_image(image)
     except Exception as e:
-        print(f"Error processing image: {str(e)}")
-        return {"error": f"Error processing uploaded image: {str(e)}"}
+        yield "error", {"error": f"Error generating image description: {e}"}
+        return
     
+    if "NO INJURIES" in description:
+        image_cache.put(exact_hash, perceptual_hash, {"diagnosis": "NO INJURIES"})
+        yield "result", {"diagnosis": "NO INJURIES"}
+        return
+    yield "description", {"description": description}
+
+    async for event in research_events(description, cache_keys=[(exact_hash, perceptual_hash)]):
+        yield event
+
+async def describe_image(image, **span_attributes):
     prompt = (
         "Describe the injury, wound, or other *treatable* conditions shown in the image. "
         "Focus on conditions that could benefit from treatment or intervention. Please be as specific "
         "and detailed as possible with what you're able to see. If you do not see any injuries, wounds, "
         "or treatable conditions, just respond with EXACTLY: 'NO INJURIES'."
     )
+    with telemetry.span("describe_image", **span_attributes):
+        return await model_client.generate_text(image_model, [prompt, image.as_part()])
+
+async def research_events(description, cache_keys=()):
+    """
+    Search, read and diagnose from an image description: the part of the analyze pipeline after
+    the photo has been described, shared by single and batch analyses.
+
+    Yields the "search_query", "links", "page" and "diagnosis" events of analysis_events and its
+    terminal "result" or "error". A successful result is cached under each (exact hash,
+    perceptual hash) pair in `cache_keys`.
+    """
+    # Pages are fetched as soon as their URLs are known, starting with the top search results
+    prefetcher = page_content_extractor.PagePrefetcher(deadline=PAGE_DEADLINE)
+    pipeline = research_pipeline_events(description, cache_keys, prefetcher)
     try:
-        response = image_model.generate_content([prompt, img])
-        description = response.text.strip()
-    except Exception as e:
-        return {"error": f"Error generating image description: {e}"}
-    
-    if "NO INJURIES" in description:
-        return {"diagnosis": "NO INJURIES"}
-    
+        async for event in pipeline:
+            yield event
+    finally:
+        # Also reached when a streaming client disconnects, so abandoned page fetches stop at once
+        prefetcher.cancel()
+        await pipeline.aclose()
+
+async def research_pipeline_events(description, cache_keys, prefetcher):
+    """The body of research_events, which cancels `prefetcher` however this generator ends."""
     # Step 2 & 3: Create search query, perform search, and evaluate results with retry logic
     max_retries = 3
-    previous_queries = set()
+    previous_queries = {}  # normalized query -> query as generated
     attempt = 0
     links = []
     search_query = ""
     search_results = []
 
-    while attempt < max_retries and not links:
-        attempt += 1
-        print(f"Search attempt {attempt} of {max_retries}")
+    if SPECULATIVE_SEARCH_QUERIES > 1:
+        # One round: several queries searched concurrently, links selected once from the merged results
+        max_retries = 1
+        try:
+            queries = await generate_search_queries(description, SPECULATIVE_SEARCH_QUERIES)
+            for query in queries:
+                yield "search_query", {"search_query": query, "attempt": 1}
+            links, used_queries = await speculative_search(description, queries, prefetcher)
+            search_query = " | ".join(used_queries or queries)
+        except HTTPException:
+            raise
+        except Exception as e:
+            print(f"Error during speculative search: {str(e)}")
+            yield "error", {"error": f"Failed to find relevant results: {str(e)}"}
+            return
+    else:
+        while attempt < max_retries and not links:
+            attempt += 1
+            print(f"Search attempt {attempt} of {max_retries}")
 
-        # Generate search query with context from previous attempts
-        retry_context = f"\nPrevious unsuccessful queries: {', '.join(previous_queries)}" if previous_queries else ""
-        variation_guidance = " Generate a different approach from previous queries." if attempt > 1 else ""
+            # Generate search query with context from previous attempts
+            retry_context = f"\nPrevious unsuccessful queries: {', '.join(previous_queries.values())}" if previous_queries else ""
+            variation_guidance = " Generate a different approach from previous queries." if attempt > 1 else ""
         
-        prompt_query = (
-            f"Create ONE good search query that would return helpful results for diagnosis and treatment "
-            f"from this description of an injury, wound, or other treatable condition. Focus on medical "
-            f"and healthcare resources.{variation_guidance} Don't respond with anything else but the "
-            f"search query. Description: {description}{retry_context}"
-        )
+            prompt_query = (
+                f"Create ONE good search query that would return helpful results for diagnosis and treatment "
+                f"from this description of an injury, wound, or other treatable condition. Focus on medical "
+                f"and healthcare resources.{variation_guidance} Don't respond with anything else but the "
+                f"search query. Description: {description}{retry_context}"
+            )
         
-        try:
-            response = which_pages_model.generate_content(prompt_query)
-            search_query = response.text.strip()
+            try:
+                with telemetry.span("generate_query", attempt=attempt):
+                    search_query = await model_client.generate_text(which_pages_model, prompt_query)
             
-            # Skip if we've tried this query before
-            if search_query in previous_queries:
-                print(f"Skipping duplicate query: {search_query}")
-                continue
+                # Skip if we've tried this query before, ignoring case, punctuation and word order
+                normalized_query = normalize_query(search_query)
+                if normalized_query in previous_queries:
+                    print(f"Skipping duplicate query: {search_query}")
+                    continue
                 
-            previous_queries.add(search_query)
-            print(f"Generated search query: {search_query}")
-            
-            search_results = await google_search.google_search(search_query)
-            
-            # Enhanced prompt for page relevance evaluation
-            prompt_pages = (
-                "From the search results provided, carefully evaluate and select pages that would be "
-                "relevant enough to help diagnose and treat this injury, wound, or other treatable "
-                "condition. Consider medical authority, relevance to the specific condition, and "
-                "treatment information. Only return links that you are confident will be helpful. "
-                "Don't respond with anything except the links to the relevant pages.\n\n"
-                f"Description: {description}\nSearch Results: {search_results}"
-            )
+                previous_queries[normalized_query] = search_query
+                print(f"Generated search query: {search_query}")
+                yield "search_query", {"search_query": search_query, "attempt": attempt}
             
-            pages_response = which_pages_model.generate_content(prompt_pages)
-            pages_links_text = pages_response.text.strip()
+                try:
+                    with telemetry.span("search", attempt=attempt, backend=search_backend.name) as span:
+                        search_results = await search_backend.search(search_query)
+                        span.set(results=len(search_results))
+                except BrowserPoolExhausted as e:
+                    raise search_busy_error(e)
+                prefetch_top_results(prefetcher, search_results)
             
-            links = [line.strip() for line in pages_links_text.splitlines() if line.strip().startswith("http")]
-            if links:
-                print(f"Found {len(links)} relevant links")
-            else:
-                print("No relevant links found, will retry with different query")
+                links = await select_links(description, search_results)
+                if links:
+                    print(f"Found {len(links)} relevant links")
+                else:
+                    print("No relevant links found, will retry with different query")
                 
-        except Exception as e:
-            print(f"Error during attempt {attempt}: {str(e)}")
-            if attempt == max_retries:
-                return {"error": f"Failed to find relevant results after {max_retries} attempts: {str(e)}"}
-            continue
+            except HTTPException:
+                raise
+            except Exception as e:
+                print(f"Error during attempt {attempt}: {str(e)}")
+                if attempt == max_retries:
+                    yield "error", {"error": f"Failed to find relevant results after {max_retries} attempts: {str(e)}"}
+                    return
+                continue
     
     # If we still don't have any links after all retries
     if not links:
-        return {
+        yield "error", {
             "error": (
                 f"Unable to find relevant medical resources after {max_retries} attempts. "
                 "Please try rephrasing the description or consult a healthcare professional directly."
             )
         }
+        return
+    yield "links", {"relevant_links": links}
     
-    # Step 4: Extract page contents
-    extracted_contents_list = await page_content_extractor.scrape_multiple_urls(links)
-    extracted_contents = dict(zip(links, extracted_contents_list))
+    # Step 4: Extract page contents, reporting each page as it finishes, until a quorum is in
+    prefetcher.keep_only(links)
+    extracted_contents = {}
+    pages_ok = 0
+    text_chars = 0
+    quorum = min(PAGE_QUORUM, len(links))
+    while prefetcher.remaining() and pages_ok < quorum and text_chars < QUORUM_TEXT_CHARS:
+        url, text = await prefetcher.next_completed()
+        extracted_contents[url] = text
+        pages_ok += bool(text)
+        text_chars += len(text)
+        yield "page", {"url": url, "status": "ok" if text else "failed", "chars": len(text)}
+    if prefetcher.remaining():
+        print(f"Starting diagnosis with {pages_ok} of {len(links)} pages, {prefetcher.remaining()} still loading")
     
-    # Step 5: Generate diagnosis response based on results
+    # Step 5: Generate diagnosis response based on the most relevant parts of the pages
+    page_context, context_stats = build_context(
+        extracted_contents, f"{description} {search_query}", CONTEXT_TOKEN_BUDGET
+    )
+    print(
+        f"Built context of {context_stats['tokens_used']} tokens from {context_stats['tokens_total']}, "
+        f"saved {context_stats['tokens_saved']}"
+    )
     prompt_diagnosis = (
         "Given the following data:\n"
         f"Description: {description}\n"
         f"Search Query: {search_query}\n"
         f"Relevant Links: {links}\n"
-        f"Page Contents: {extracted_contents}\n\n"
+        f"Page Contents:\n{page_context}\n\n"
         "You are a caring healthcare professional providing a thoughtful analysis. "
         "Maintain a warm, friendly, and empathetic tone throughout your response. "
         "Based on the given data, provide a clear and reassuring diagnosis evaluation. "
@@ -196,48 +612,426 @@ async def analyze(request: ImageRequest):
         "Avoid medical jargon where possible, or explain it when necessary. "
         "Don't use markdown or any other formatting."
     )
+    diagnosis_failed = False
+    diagnosis_task = asyncio.ensure_future(telemetry.traced(
+        "diagnosis", model_client.generate_text(which_pages_model, prompt_diagnosis), pages=len(extracted_contents)
+    ))
     try:
-        diagnosis_response = which_pages_model.generate_content(prompt_diagnosis).text.strip()
+        # Stragglers that finish while the diagnosis is generated still go into the chat context
+        while prefetcher.remaining() and not diagnosis_task.done():
+            next_page = asyncio.ensure_future(prefetcher.next_completed())
+            await asyncio.wait({diagnosis_task, next_page}, return_when=asyncio.FIRST_COMPLETED)
+            if not next_page.done():
+                next_page.cancel()
+                break
+            url, text = next_page.result()
+            extracted_contents[url] = text
+            yield "page", {"url": url, "status": "ok" if text else "failed", "chars": len(text), "late": True}
+        diagnosis_response = await diagnosis_task
     except Exception as e:
         diagnosis_response = f"Error generating diagnosis response: {e}"
+        diagnosis_failed = True
+    finally:
+        diagnosis_task.cancel()
+        prefetcher.cancel()
+    yield "diagnosis", {"diagnosis": diagnosis_response}
+    extracted_contents = {url: extracted_contents[url] for url in links if url in extracted_contents}
     
     final_result = {
         "description": description,
         "search_query": search_query,
         "relevant_links": links,
         "page_contents": extracted_contents,
-        "diagnosis": diagnosis_response
+        "diagnosis": diagnosis_response,
+        "context_stats": context_stats,
     }
+    if not diagnosis_failed:
+        for exact_hash, perceptual_hash in cache_keys:
+            image_cache.put(exact_hash, perceptual_hash, dict(final_result))
+    final_result["session_id"] = create_chat_session(final_result)
     
-    return JSONResponse(content=final_result)
+    yield "result", final_result
+
+async def cached_analysis_events(cached, match):
+    """Replay the stages of a cached analysis, with a fresh chat session."""
+    for event, key in (("description", "description"), ("search_query", "search_query"),
+                       ("links", "relevant_links"), ("diagnosis", "diagnosis")):
+        if key in cached:
+            yield event, {key: cached[key]}
+    result = dict(cached, cache=match)
+    if "description" in cached:
+        result["session_id"] = create_chat_session(cached)
+    yield "result", result
+
+def create_chat_session(result):
+    """Start a chat session holding only the analysis fields and page passages chat prompts use."""
+    context = {key: result[key] for key in ("description", "search_query", "relevant_links", "diagnosis")}
+    context["page_contents"], _ = select_passages(
+        result["page_contents"], f"{result['description']} {result['search_query']}", SESSION_CONTEXT_TOKEN_BUDGET
+    )
+    return session_store.create(context)
+
+async def batch_analysis_events(images):
+    """
+    Run the analyze pipeline once for several photos of the same injury.
+
+    The photos are described concurrently, yielding an "image_description" event with the photo's
+    index as each finishes. The descriptions are then merged into one, which goes through a single
+    search, scrape and diagnosis, so the events that follow match analysis_events. The result adds
+    "descriptions", one entry per photo with either its "description" or an "error".
+    """
+    async def describe(index, image):
+        # A photo analyzed before needn't be described again
+        exact_hash, perceptual_hash = await asyncio.to_thread(fingerprint, image)
+        cached, _ = image_cache.get(exact_hash, perceptual_hash)
+        if cached is not None:
+            return index, cached.get("description", "NO INJURIES")
+        return index, await describe_image(image, photo=index)
+
+    async def describe_safely(index, image):
+        try:
+            return await describe(index, image)
+        except Exception as e:
+            return index, e
+
+    descriptions = [None] * len(images)
+    tasks = [describe_safely(index, image) for index, image in enumerate(images)]
+    for next_done in asyncio.as_completed(tasks):
+        index, description = await next_done
+        if isinstance(description, Exception):
+            descriptions[index] = {"index": index, "error": f"Error generating image description: {description}"}
+        else:
+            descriptions[index] = {"index": index, "description": description}
+        yield "image_description", descriptions[index]
+
+    injuries = [
+        entry for entry in descriptions
+        if "description" in entry and "NO INJURIES" not in entry["description"]
+    ]
+    if not injuries:
+        if all("error" in entry for entry in descriptions):
+            yield "error", {"error": descriptions[0]["error"], "descriptions": descriptions}
+        else:
+            yield "result", {"diagnosis": "NO INJURIES", "descriptions": descriptions}
+        return
+
+    if len(injuries) == 1:
+        description = injuries[0]["description"]
+    else:
+        description = "\n\n".join(f"Photo {entry['index'] + 1}: {entry['description']}" for entry in injuries)
+    yield "description", {"description": description}
+
+    async for event, data in research_events(description):
+        if event == "result":
+            data["descriptions"] = descriptions
+        yield event, data
+
+async def analysis_response(events):
+    async for event, data in events:
+        if event == "error":
+            return data
+        if event == "result":
+            return JSONResponse(content=data)
+
+def analysis_stream_response(events):
+    async def stream():
+        try:
+            async for event, data in events:
+                yield json.dumps({"event": event, **data}) + "\n"
+        except HTTPException as e:
+            # Headers are already sent, so report it in-band instead of as a status code
+            yield json.dumps({"event": "error", "error": e.detail}) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+async def run_analysis_job(job_id, image_data):
+    """
+    Run the analyze pipeline for a queued job, recording each stage and the final result or
+    error in the job store. Jobs share the admission budget with synchronous /analyze calls.
+    """
+    try:
+        while True:
+            try:
+                await admission.acquire(ANALYZE_COST)
+                break
+            except AdmissionRejected as e:
+                # Keep the heartbeat fresh so the reaper doesn't take a waiting job for a dead one
+                job_store.update(job_id, stage="waiting")
+                await asyncio.sleep(e.retry_after)
+    except asyncio.CancelledError:
+        job_store.update(job_id, status=QUEUED, stage=None)
+        raise
+    started = time.perf_counter()
+    try:
+        try:
+            # The payload was downsized and re-encoded at submit time
+            image = await asyncio.to_thread(load_prepared, image_data)
+        except Exception as e:
+            job_store.update(job_id, status=FAILED, error=f"Error processing uploaded image: {str(e)}")
+            return
+
+        async for event, data in analysis_events(image):
+            if event == "result":
+                job_store.update(job_id, status=DONE, stage=event, result=data)
+            elif event == "error":
+                job_store.update(job_id, status=FAILED, stage=event, error=data["error"])
+            else:
+                job_store.update(job_id, stage=event)
+    except HTTPException as e:
+        # Search was busy: try again later unless the job has used up its attempts
+        job = job_store.get(job_id)
+        if job is not None and job["attempts"] < JOB_MAX_ATTEMPTS:
+            await asyncio.sleep(int(e.headers.get("Retry-After", 5)) if e.headers else 5)
+            job_store.update(job_id, status=QUEUED, stage=None)
+        else:
+            job_store.update(job_id, status=FAILED, error=e.detail)
+    except asyncio.CancelledError:
+        job_store.update(job_id, status=QUEUED, stage=None)
+        raise
+    except Exception as e:
+        # Fail now with the real error rather than leaving the job running until the reaper gives up on it
+        print(f"Job {job_id} failed: {e}")
+        job_store.update(job_id, status=FAILED, error=f"Error analyzing image: {e}")
+    finally:
+        admission.release(ANALYZE_COST, time.perf_counter() - started)
+
+def job_status(job):
+    status_body = {key: job[key] for key in ("job_id", "status", "stage", "created_at", "updated_at")}
+    if job["error"]:
+        status_body["error"] = job["error"]
+    return status_body
+
+async def submit_analysis_job(image_data):
+    """Queue the downsized photo rather than the raw upload, so waiting jobs hold little memory."""
+    try:
+        image = await load_image(image_data)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error processing image: {str(e)}")
+        return {"error": f"Error processing uploaded image: {str(e)}"}
+    if (job_store.queued_count() >= JOB_MAX_QUEUED
+            or job_store.queued_bytes() + len(image.data) > JOB_MAX_QUEUED_BYTES):
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many queued jobs, please try again shortly",
+            headers={"Retry-After": "30"},
+        )
+    job_id = job_store.submit(image.data)
+    if job_workers is not None:
+        job_workers.notify()
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content={"job_id": job_id, "status": QUEUED, "status_url": f"/jobs/{job_id}", "result_url": f"/jobs/{job_id}/result"},
+    )
+
+@app.post("/analyze")
+async def analyze(request: ImageRequest):
+    try:
+        print(f"Received request with image data length: {len(request.image)}")
+        image = await load_image(request.get_image_bytes)
+    except HTTPException as e:
+        # Re-raise validation errors
+        raise e
+    except Exception as e:
+        print(f"Error processing image: {str(e)}")
+        return {"error": f"Error processing uploaded image: {str(e)}"}
+
+    return await analysis_response(analysis_events(image))
+
+@app.post("/analyze/stream")
+async def analyze_stream(request: ImageRequest):
+    """
+    Same pipeline as /analyze, streamed as newline-delimited JSON. Each line is an object with an
+    "event" key plus that stage's data, so clients can show progress as soon as the image has
+    been described. The last line is either the "result" event, carrying the same body /analyze
+    returns, or an "error" event.
+    """
+    try:
+        image = await load_image(request.get_image_bytes)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        print(f"Error processing image: {str(e)}")
+        return {"error": f"Error processing uploaded image: {str(e)}"}
+
+    return analysis_stream_response(analysis_events(image))
+
+@app.post("/analyze/upload")
+async def analyze_upload(image: UploadFile = File(...), stream: bool = False):
+    """
+    Same as /analyze (or /analyze/stream with ?stream=true), but takes the photo as a multipart
+    file upload, which avoids the base64 overhead of the JSON endpoints.
+    """
+    try:
+        image_data = await image.read(MAX_UPLOAD_BYTES + 1)
+        check_upload_size(len(image_data), MAX_UPLOAD_BYTES)
+        prepared = await load_image(image_data)
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        print(f"Error processing image: {str(e)}")
+        return {"error": f"Error processing uploaded image: {str(e)}"}
+
+    if stream:
+        return analysis_stream_response(analysis_events(prepared))
+    return await analysis_response(analysis_events(prepared))
+
+@app.post("/analyze/batch")
+async def analyze_batch(request: BatchImageRequest, stream: bool = False):
+    """
+    Analyze several photos of the same injury together. Each photo is described, but the
+    descriptions share one search, one set of scraped pages and one diagnosis, instead of running
+    the whole pipeline once per photo. With ?stream=true the response is streamed like
+    /analyze/stream, with an "image_description" event per photo before the combined stages.
+    """
+    try:
+        images = await asyncio.gather(*(load_image(image_data) for image_data in request.get_images_bytes))
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        print(f"Error processing image: {str(e)}")
+        return {"error": f"Error processing uploaded image: {str(e)}"}
+
+    if stream:
+        return analysis_stream_response(batch_analysis_events(images))
+    return await analysis_response(batch_analysis_events(images))
+
+@app.post("/analyze/batch/upload")
+async def analyze_batch_upload(images: List[UploadFile] = File(...), stream: bool = False):
+    """Same as /analyze/batch, but takes the photos as multipart file uploads."""
+    if len(images) > MAX_BATCH_IMAGES:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Send between 1 and {MAX_BATCH_IMAGES} images"
+        )
+    try:
+        images_data = []
+        for image in images:
+            image_data = await image.read(MAX_UPLOAD_BYTES + 1)
+            check_upload_size(len(image_data), MAX_UPLOAD_BYTES)
+            images_data.append(image_data)
+        prepared = await asyncio.gather(*(load_image(image_data) for image_data in images_data))
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        print(f"Error processing image: {str(e)}")
+        return {"error": f"Error processing uploaded image: {str(e)}"}
+
+    if stream:
+        return analysis_stream_response(batch_analysis_events(prepared))
+    return await analysis_response(batch_analysis_events(prepared))
+
+@app.post("/jobs/analyze")
+async def submit_analyze_job(request: ImageRequest):
+    """
+    Queue the /analyze pipeline and return a job ID at once, so clients on flaky connections
+    don't have to hold a request open. Poll /jobs/{job_id} for progress and fetch the response
+    body /analyze would have returned from /jobs/{job_id}/result.
+    """
+    return await submit_analysis_job(request.get_image_bytes)
+
+@app.post("/jobs/analyze/upload")
+async def submit_analyze_upload_job(image: UploadFile = File(...)):
+    """Same as /jobs/analyze, taking the photo as a multipart file upload."""
+    image_data = await image.read(MAX_UPLOAD_BYTES + 1)
+    try:
+        check_upload_size(len(image_data), MAX_UPLOAD_BYTES)
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    return await submit_analysis_job(image_data)
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found or expired")
+    return job_status(job)
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """
+    The job's /analyze response once it is done, or its error once it has failed. Until then,
+    202 with the job's status and a Retry-After header.
+    """
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found or expired")
+    if job["status"] == DONE:
+        return JSONResponse(content=job["result"])
+    if job["status"] == FAILED:
+        return {"error": job["error"]}
+    return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=job_status(job), headers={"Retry-After": "2"})
+
+def build_chat_prompt(context, message):
+    # Only the passages relevant to the condition and the question go into the prompt
+    page_context, context_stats = build_context(
+        context['page_contents'], f"{context['description']} {message}", CONTEXT_TOKEN_BUDGET
+    )
+    print(f"Built chat context of {context_stats['tokens_used']} tokens, saved {context_stats['tokens_saved']}")
+    # Create a prompt that includes the context and current message
+    return (
+        "You are a knowledgeable healthcare professional assistant. "
+        "Maintain a warm, professional, and empathetic tone while providing accurate medical guidance. "
+        "Use the following context about the patient's condition to inform your response.\n\n"
+        f"Context:\n"
+        f"Description of condition: {context['description']}\n"
+        f"Initial diagnosis: {context['diagnosis']}\n"
+        f"Relevant medical information from trusted sources:\n{page_context}\n\n"
+        f"Patient's message: {message}\n\n"
+        "In your response:\n"
+        "1. Acknowledge their concerns or questions with empathy\n"
+        "2. Provide clear, accurate information based on the context\n"
+        "3. Be honest about any limitations in your knowledge\n"
+        "4. If they need medical attention, remind them professionally but firmly\n"
+        "5. Use simple, understandable language while maintaining professionalism\n"
+        "6. Focus on being supportive and reassuring while staying factual\n\n"
+        "Keep your response concise and easily readable on a mobile app interface. "
+        "Avoid technical jargon unless necessary, and explain medical terms when used. "
+        "Don't use any markdown formatting."
+    )
+
+def build_chat_contents(request: ChatRequest):
+    """
+    Build the model input for a chat message.
+
+    With a session, the first message carries the stored analysis context and later messages are
+    sent as plain turns after the session's history. Without one, the client-sent context is used.
+
+    Returns:
+        tuple: (contents, session, user_turn) where session is None for context-only requests.
+    """
+    if request.session_id is None:
+        return build_chat_prompt(request.context, request.message), None, None
+
+    session = session_store.get(request.session_id)
+    if session is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Chat session not found or expired, please analyze the image again",
+        )
+    history = session["history"]
+    user_turn = build_chat_prompt(session["context"], request.message) if not history else request.message
+    return history + [{"role": "user", "parts": [user_turn]}], session, user_turn
+
+def remember_chat_turn(session_id, user_turn, reply):
+    # Appended in the store rather than saved whole, so overlapping turns on one session both stick
+    if not session_store.append_exchange(session_id, user_turn, reply, MAX_CHAT_HISTORY_TURNS):
+        print(f"Chat session {session_id} expired before its reply was stored")
 
 @app.post("/chat")
 async def chat(request: ChatRequest):
+    contents, session, user_turn = build_chat_contents(request)
     try:
-        # Create a prompt that includes the context and current message
-        prompt = (
-            "You are a knowledgeable healthcare professional assistant. "
-            "Maintain a warm, professional, and empathetic tone while providing accurate medical guidance. "
-            "Use the following context about the patient's condition to inform your response.\n\n"
-            f"Context:\n"
-            f"Description of condition: {request.context['description']}\n"
-            f"Initial diagnosis: {request.context['diagnosis']}\n"
-            f"Relevant medical information from trusted sources: {request.context['page_contents']}\n\n"
-            f"Patient's message: {request.message}\n\n"
-            "In your response:\n"
-            "1. Acknowledge their concerns or questions with empathy\n"
-            "2. Provide clear, accurate information based on the context\n"
-            "3. Be honest about any limitations in your knowledge\n"
-            "4. If they need medical attention, remind them professionally but firmly\n"
-            "5. Use simple, understandable language while maintaining professionalism\n"
-            "6. Focus on being supportive and reassuring while staying factual\n\n"
-            "Keep your response concise and easily readable on a mobile app interface. "
-            "Avoid technical jargon unless necessary, and explain medical terms when used. "
-            "Don't use any markdown formatting."
-        )
-        
-        response = which_pages_model.generate_content(prompt)
-        return JSONResponse(content={"response": response.text.strip()})
+        with telemetry.span("chat"):
+            response = await model_client.generate_text(which_pages_model, contents)
+        if session is not None:
+            remember_chat_turn(request.session_id, user_turn, response)
+        return JSONResponse(content={"response": response})
         
     except Exception as e:
         return JSONResponse(
@@ -245,6 +1039,40 @@ async def chat(request: ChatRequest):
             status_code=500
         )
 
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest, http_request: Request):
+    """
+    Same as /chat, but streams the reply as newline-delimited JSON: one {"event": "token", "text": ...}
+    line per chunk as the model produces it, then {"event": "done"} or {"event": "error", ...}.
+    Generation is cancelled if the client disconnects.
+    """
+    contents, session, user_turn = build_chat_contents(request)
+
+    async def stream():
+        chunks = model_client.stream_text(which_pages_model, contents)
+        reply = []
+        try:
+            async for text in chunks:
+                if await http_request.is_disconnected():
+                    print("Client disconnected, cancelling chat response")
+                    return
+                reply.append(text)
+                yield json.dumps({"event": "token", "text": text}) + "\n"
+            if session is not None:
+                remember_chat_turn(request.session_id, user_turn, "".join(reply).strip())
+            yield json.dumps({"event": "done"}) + "\n"
+        except Exception as e:
+            yield json.dumps({"event": "error", "error": f"Error generating response: {str(e)}"}) + "\n"
+        finally:
+            await chunks.aclose()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@app.get("/metrics")
+async def metrics():
+    """Request, stage, token and cache metrics in the Prometheus text format."""
+    return PlainTextResponse(telemetry.render_metrics(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,82 @@
+"""
+Compare the main-text extraction backends in html_parsing on a corpus of saved pages.
+
+Usage:
+    python benchmarks/bench_html_parsing.py [PAGES_DIR] [--repeat N]
+
+PAGES_DIR defaults to benchmarks/corpus/pages; point it at a directory of real saved pages
+for numbers closer to production.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from html_parsing import BACKENDS, extract_main_text  # noqa: E402
+
+DEFAULT_PAGES = Path(__file__).resolve().parent / "corpus" / "pages"
+
+# Small documents where parsers tend to disagree, checked alongside the corpus
+EDGE_CASES = [
+    ("inline-script", "<p>Before<script>x</script>After text</p>"),
+    ("inline-nav", "<p>Before<nav>menu</nav>After</p>"),
+    ("inline-role", "<p>Text<span role='dialog'>close</span>continues</p>"),
+    ("inline-hint", "<div>Text<div class='cookie-bar'>ok</div>continues</div>"),
+    ("hinted-body", "<body class='modal-open cookie-consent-pending'><p>Short page text</p></body>"),
+    ("hinted-wrapper", "<body><div class='page-share-wrapper'><article><p>Short article</p></article></div></body>"),
+    ("no-body", "<html><head><title>Title</title></head><p>Only text</p></html>"),
+    ("fragment", "<!DOCTYPE html><title>Title</title><p>Fragment</p>"),
+    ("empty", ""),
+]
+
+def load_pages(directory):
+    pages = []
+    for path in sorted(Path(directory).glob("*.htm*")):
+        pages.append((path.name, path.read_text(encoding="utf-8", errors="replace")))
+    return pages
+
+def bench(backend, pages, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for _, html in pages:
+            extract_main_text(html, backend)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pages", nargs="?", default=DEFAULT_PAGES)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    pages = load_pages(args.pages)
+    if not pages:
+        sys.exit(f"No .html pages found in {args.pages}")
+    total_bytes = sum(len(html.encode("utf-8")) for _, html in pages)
+    print(f"{len(pages)} pages, {total_bytes / 1024:.0f} KiB, {args.repeat} rounds\n")
+
+    # Every backend should agree on the text; a mismatch means the boilerplate rules drifted apart
+    checked = pages + EDGE_CASES
+    reference = {name: extract_main_text(html, "html.parser") for name, html in checked}
+    mismatches = 0
+    for backend in BACKENDS:
+        for name, html in checked:
+            if extract_main_text(html, backend) != reference[name]:
+                mismatches += 1
+                print(f"warning: {backend} output differs from html.parser on {name}")
+
+    baseline = None
+    print(f"{'backend':<12} {'pages/s':>10} {'MB/s':>8} {'ms/page':>9} {'speedup':>8}")
+    for backend in reversed(list(BACKENDS)):
+        bench(backend, pages, 1)  # warm up
+        elapsed = bench(backend, pages, args.repeat)
+        count = len(pages) * args.repeat
+        baseline = baseline or elapsed
+        print(f"{backend:<12} {count / elapsed:>10.1f} {total_bytes * args.repeat / elapsed / 1e6:>8.2f} "
+              f"{elapsed / count * 1000:>9.2f} {baseline / elapsed:>7.1f}x")
+    if mismatches:
+        sys.exit(f"\n{mismatches} backend outputs differ from html.parser")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Check serp_parser against saved Google result pages and time it, without launching a browser.
+
+Every NAME.html in the corpus is parsed and compared with the expected results in NAME.json;
+any difference is printed and the script exits non-zero. Parse time per page is reported after.
+
+Usage:
+    python benchmarks/bench_serp_parser.py [SERP_DIR] [--repeat N] [--update]
+
+Use --update after a deliberate parser change to rewrite the expected results, then review
+the diff of the .json files before committing.
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from serp_parser import parse_serp  # noqa: E402
+
+DEFAULT_SERPS = Path(__file__).resolve().parent / "corpus" / "serp"
+
+def check(pages, update):
+    failures = 0
+    for path, html in pages:
+        results = parse_serp(html)
+        expected_path = path.with_suffix(".json")
+        if update:
+            expected_path.write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+            print(f"updated {expected_path.name}")
+            continue
+        if not expected_path.exists():
+            print(f"FAIL {path.name}: no {expected_path.name}, run with --update")
+            failures += 1
+            continue
+        expected = json.loads(expected_path.read_text(encoding="utf-8"))
+        if results == expected:
+            print(f"ok   {path.name}: {len(results)} results")
+            continue
+        failures += 1
+        print(f"FAIL {path.name}: got {len(results)} results, expected {len(expected)}")
+        for i in range(max(len(results), len(expected))):
+            got = results[i] if i < len(results) else None
+            want = expected[i] if i < len(expected) else None
+            if got != want:
+                print(f"  #{i}\n    got:      {got}\n    expected: {want}")
+    return failures
+
+def bench(pages, repeat):
+    print(f"\n{'page':<16} {'KiB':>7} {'ms/parse':>9}")
+    for path, html in pages:
+        parse_serp(html)  # warm up
+        start = time.perf_counter()
+        for _ in range(repeat):
+            parse_serp(html)
+        elapsed = (time.perf_counter() - start) / repeat
+        print(f"{path.name:<16} {len(html.encode('utf-8')) / 1024:>7.1f} {elapsed * 1000:>9.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("serps", nargs="?", default=DEFAULT_SERPS)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--update", action="store_true", help="rewrite the expected .json files")
+    args = parser.parse_args()
+
+    pages = [(path, path.read_text(encoding="utf-8")) for path in sorted(Path(args.serps).glob("*.html"))]
+    if not pages:
+        sys.exit(f"No .html pages found in {args.serps}")
+    failures = check(pages, args.update)
+    bench(pages, args.repeat)
+    if failures:
+        sys.exit(f"\n{failures} page(s) parsed differently than expected")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""
+Deterministic stand-ins for Gemini, Google search and page fetching, so the app can be
+load-tested without API keys, network access or Chrome.
+
+The fakes replace the lowest layers only: the real search cache, SERP parser, prefetcher,
+context builder and HTML extraction all still run. Each fake sleeps for a delay drawn from a
+configurable latency distribution.
+
+In-process use goes through load_test.py. To size uvicorn workers, serve the faked app with
+    FAKE_MODEL_LATENCY=lognormal:1,0.4 uvicorn --app-dir benchmarks fakes:create_app --factory --workers 4
+from the backend directory and point load_test.py --url at it.
+"""
+import asyncio
+import hashlib
+import html
+import math
+import os
+import random
+import re
+import sys
+from contextlib import asynccontextmanager
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("GOOGLE_API_KEY", "offline")
+
+CORPUS_PAGES = Path(__file__).resolve().parent / "corpus" / "pages"
+
+class Latency:
+    """
+    A latency distribution parsed from a spec string, in seconds:
+    "fixed:0.5", "uniform:0.2,1.0" or "lognormal:MEDIAN,SIGMA".
+    """
+
+    def __init__(self, spec, scale=1.0, seed=0):
+        self.spec = spec
+        self.scale = scale
+        kind, _, args = spec.partition(":")
+        self.kind = kind
+        self.args = [float(arg) for arg in args.split(",") if arg]
+        if kind not in ("fixed", "uniform", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {spec}")
+        self._rng = random.Random(seed)
+
+    def sample(self):
+        if self.kind == "fixed":
+            value = self.args[0]
+        elif self.kind == "uniform":
+            value = self._rng.uniform(self.args[0], self.args[1])
+        else:
+            value = self._rng.lognormvariate(math.log(self.args[0]), self.args[1])
+        return value * self.scale
+
+    async def wait(self):
+        await asyncio.sleep(self.sample())
+
+class FakeUsage:
+    def __init__(self, prompt_token_count, candidates_token_count):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+
+class FakeResponse:
+    def __init__(self, text, usage=None):
+        self.text = text
+        self.parts = [text] if text else []
+        self.usage_metadata = usage
+
+class FakeGenerativeModel:
+    """
+    Stand-in for genai.GenerativeModel that answers each of the app's prompts with a plausible
+    canned reply after a simulated delay. Supports stream=True for /chat/stream.
+    """
+
+    def __init__(self, model_name, latency, failure_rate=0.0, seed=0):
+        self.model_name = f"models/{model_name}"
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self._rng = random.Random(seed)
+
+    async def generate_content_async(self, contents, stream=False):
+        prompt = _prompt_text(contents)
+        await self.latency.wait()
+        if self._rng.random() < self.failure_rate:
+            from google.api_core import exceptions as api_exceptions
+            raise api_exceptions.ResourceExhausted("Simulated rate limit")
+        text = self._reply(prompt)
+        usage = FakeUsage(len(prompt) // 4, len(text) // 4)
+        if not stream:
+            return FakeResponse(text, usage)
+        return self._stream(text, usage)
+
+    async def _stream(self, text, usage):
+        words = text.split(" ")
+        for i in range(0, len(words), 4):
+            await asyncio.sleep(0.02 * self.latency.scale)
+            yield FakeResponse(" ".join(words[i:i + 4]) + " ", usage if i + 4 >= len(words) else None)
+
+    def _reply(self, prompt):
+        if "Describe the injury" in prompt:
+            return self._rng.choice(DESCRIPTIONS)
+        count = re.search(r"Create (\d+) different search queries", prompt)
+        if count:
+            return "\n".join(f"{i + 1}. {query}" for i, query in enumerate(QUERIES[:int(count.group(1))]))
+        if "Create ONE good search query" in prompt:
+            return self._rng.choice(QUERIES)
+        if "From the search results" in prompt:
+            links = list(dict.fromkeys(re.findall(r"'link': '([^']+)'", prompt)))
+            return "\n".join(links[:4])
+        return DIAGNOSIS
+
+def _prompt_text(contents):
+    """Flatten a prompt string, a list of parts or a list of chat turns into its text."""
+    if isinstance(contents, str):
+        return contents
+    texts = []
+    for part in contents:
+        if isinstance(part, str):
+            texts.append(part)
+        elif isinstance(part, dict) and "parts" in part:
+            texts.append(_prompt_text(part["parts"]))
+    return " ".join(texts)
+
+DESCRIPTIONS = [
+    "A shallow laceration about 2 cm long on the palm side of the index finger, with minor bleeding "
+    "and slightly raised edges. No visible debris.",
+    "A superficial burn on the back of the hand, roughly 3 by 4 cm, red with two small intact "
+    "blisters. The surrounding skin is mildly swollen.",
+    "A purple bruise about 5 cm across on the outer thigh with faint yellow edges and no broken skin.",
+    "A raised red welt on the forearm with a small central puncture and surrounding swelling, "
+    "consistent with an insect sting.",
+]
+QUERIES = [
+    "minor finger laceration first aid",
+    "superficial burn blister treatment",
+    "bruise healing stages when to see doctor",
+    "insect sting swelling treatment",
+    "wound infection signs",
+]
+DIAGNOSIS = (
+    "I'm sorry you're dealing with this; it looks like a minor injury that should heal well with "
+    "home care. Rinse it gently with clean water, keep it covered and watch for spreading redness, "
+    "warmth or pus. If it is still getting worse after two days, or you develop a fever, please "
+    "see a doctor."
+)
+SITES = ["nhs.uk", "mayoclinic.org", "medlineplus.gov", "clevelandclinic.org", "aad.org",
+         "healthline.com", "webmd.com", "hopkinsmedicine.org", "redcross.org", "cdc.gov"]
+
+def serp_html(query, count=10):
+    """A desktop-layout results page for `query`, with Google redirect links like the real thing."""
+    slug = re.sub(r"\W+", "-", query.lower()).strip("-")
+    results = []
+    for i, site in enumerate(SITES[:count]):
+        url = f"https://www.{site}/health/{slug}-{i}"
+        href = f"/url?q={url}&amp;sa=U" if i % 3 == 0 else url
+        results.append(
+            f'<div class="MjjYud"><div class="g tF2Cxc" data-hveid="CA{i}"><div class="yuRUbf"><a href="{href}">'
+            f'<h3 class="LC20lb">{html.escape(query.title())} - {site}</h3><cite>{site}</cite></a></div>'
+            f'<div class="VwiC3b" style="-webkit-line-clamp:2"><span>Learn about {html.escape(query)}: '
+            f'symptoms, home care and when to get medical help.</span></div></div></div>'
+        )
+    padding = "".join(f"<script>var _x{i}={'0' * 200};</script>" for i in range(100))
+    return (
+        f"<html><head><title>{html.escape(query)} - Google Search</title>{padding}</head><body>"
+        f'<div id="main"><div id="rso">{"".join(results)}</div></div></body></html>'
+    )
+
+class FakeSerpFetcher:
+    """Replaces google_search._fetch_with_browser, so only the browser round trip is simulated."""
+
+    def __init__(self, latency):
+        self.latency = latency
+
+    async def __call__(self, url):
+        await self.latency.wait()
+        query = parse_qs(urlsplit(url).query).get("q", [""])[0]
+        return serp_html(query)
+
+class FakeExtractionEngine:
+    """
+    Replaces ExtractionEngine: each URL maps deterministically to a page from the benchmark
+    corpus, which goes through the real main-text extraction after a simulated fetch delay.
+    """
+
+    def __init__(self, latency, failure_rate=0.0, seed=0, max_concurrency=10):
+        from html_parsing import extract_main_text
+
+        self._extract = extract_main_text
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.cache = None
+        self._rng = random.Random(seed)
+        self._pages = [path.read_text(encoding="utf-8") for path in sorted(CORPUS_PAGES.glob("*.html"))]
+        self._limit = asyncio.Semaphore(max_concurrency)
+
+    async def get_page_text_content(self, url):
+        async with self._limit:
+            await self.latency.wait()
+            if self._rng.random() < self.failure_rate:
+                return ""
+            digest = int(hashlib.md5(url.encode("utf-8")).hexdigest(), 16)
+            return await asyncio.to_thread(self._extract, self._pages[digest % len(self._pages)])
+
+    async def scrape_multiple_urls(self, urls):
+        return await asyncio.gather(*(self.get_page_text_content(url) for url in urls))
+
+    async def close(self):
+        pass
+
+DEFAULTS = {
+    "image_latency": "lognormal:2.5,0.3",
+    "model_latency": "lognormal:1.0,0.4",
+    "search_latency": "lognormal:4.5,0.2",
+    "page_latency": "lognormal:0.8,0.8",
+    "model_failure_rate": 0.0,
+    "page_failure_rate": 0.05,
+    "time_scale": 1.0,
+    "image_cache": False,
+    "seed": 1,
+}
+
+def install_fakes(app_module, **config):
+    """
+    Point `app_module` at the fakes and replace its lifespan, so no browser or network is used.
+
+    Args:
+        app_module: The imported app module.
+        **config: Overrides for DEFAULTS (latency specs, failure rates, time_scale, seed, and
+            image_cache to keep reusing analyses of repeated photos).
+    """
+    import google_search
+    import html_parsing
+    import page_content_extractor
+    import telemetry
+    from image_cache import ImageResultCache
+    from search_cache import SearchCache
+
+    config = {**DEFAULTS, **config}
+    scale, seed = config["time_scale"], config["seed"]
+
+    def latency(name, offset):
+        return Latency(config[name], scale, seed + offset)
+
+    app_module.image_model = FakeGenerativeModel(
+        "fake-image", latency("image_latency", 1), config["model_failure_rate"], seed + 1)
+    app_module.which_pages_model = FakeGenerativeModel(
+        "fake-text", latency("model_latency", 2), config["model_failure_rate"], seed + 2)
+    google_search._fetch_with_browser = FakeSerpFetcher(latency("search_latency", 3))
+    if not config["image_cache"]:
+        # Every request should run the whole pipeline, even though the harness reuses a few photos
+        app_module.image_cache = ImageResultCache(max_entries=0)
+
+    @asynccontextmanager
+    async def fake_lifespan(app):
+        search_cache = SearchCache()
+        google_search.set_search_cache(search_cache)
+        engine = FakeExtractionEngine(latency("page_latency", 4), config["page_failure_rate"], seed + 4)
+        page_content_extractor.set_engine(engine)
+        html_parsing.set_default_backend(os.environ.get("HTML_PARSER"))
+        telemetry.register_stats("search_cache", search_cache.stats)
+        yield
+        telemetry.register_stats("search_cache", None)
+        google_search.set_search_cache(None)
+        page_content_extractor.set_engine(None)
+
+    app_module.app.router.lifespan_context = fake_lifespan
+    return app_module.app
+
+def create_app():
+    """uvicorn --factory entry point; fakes are configured from FAKE_<NAME> environment variables."""
+    import app as app_module
+
+    config = {}
+    for name, default in DEFAULTS.items():
+        value = os.environ.get(f"FAKE_{name.upper()}")
+        if value is not None:
+            config[name] = value.lower() in ("1", "true", "yes") if isinstance(default, bool) else type(default)(value)
+    return install_fakes(app_module, **config)
@@ -0,0 +1,204 @@
+"""
+Drive the app at a fixed concurrency and report latency percentiles, throughput and peak RSS.
+
+By default the app runs in this process with the offline fakes from fakes.py, so no API key,
+network or Chrome is needed. Latencies are drawn from the given distributions and can be
+shrunk with --time-scale for a quick run:
+
+    python benchmarks/load_test.py --concurrency 16 --requests 200
+    python benchmarks/load_test.py --endpoint chat --model-latency lognormal:0.8,0.3
+    python benchmarks/load_test.py --time-scale 0.01 --requests 500 --json report.json
+    python benchmarks/load_test.py --endpoint analyze-batch --batch-size 3
+
+With --url the requests go to a running server instead (see fakes.py for serving the faked
+app under uvicorn with several workers); RSS is then only reported for this process.
+"""
+import argparse
+import asyncio
+import base64
+import contextlib
+import io
+import json
+import os
+import random
+import resource
+import sys
+import time
+
+import httpx
+from PIL import Image, ImageDraw
+
+import fakes
+
+def make_images(count, seed, size=(1280, 960)):
+    """Distinct JPEG photos as base64 strings, built before the run so encoding isn't timed."""
+    rng = random.Random(seed)
+    images = []
+    for _ in range(count):
+        img = Image.new("RGB", size, tuple(rng.randrange(120, 230) for _ in range(3)))
+        draw = ImageDraw.Draw(img)
+        for _ in range(40):
+            x, y = rng.randrange(size[0]), rng.randrange(size[1])
+            r = rng.randrange(10, 200)
+            draw.ellipse((x - r, y - r, x + r, y + r), fill=tuple(rng.randrange(256) for _ in range(3)))
+        buffer = io.BytesIO()
+        img.save(buffer, format="JPEG", quality=90)
+        images.append(base64.b64encode(buffer.getvalue()).decode("ascii"))
+    return images
+
+CHAT_CONTEXT = {
+    "description": fakes.DESCRIPTIONS[0],
+    "diagnosis": fakes.DIAGNOSIS,
+    "page_contents": {"https://www.nhs.uk/conditions/cuts-and-grazes/": "Clean the wound and cover it. " * 300},
+}
+
+def build_request(endpoint, images, i, batch_size=3):
+    if endpoint == "analyze-batch":
+        return "/analyze/batch", {"images": [images[(i + k) % len(images)] for k in range(batch_size)]}
+    if endpoint == "analyze":
+        return "/analyze", {"image": images[i % len(images)]}
+    if endpoint == "analyze-stream":
+        return "/analyze/stream", {"image": images[i % len(images)]}
+    if endpoint == "chat":
+        return "/chat", {"message": "How long will it take to heal?", "context": CHAT_CONTEXT}
+    if endpoint == "chat-stream":
+        return "/chat/stream", {"message": "How long will it take to heal?", "context": CHAT_CONTEXT}
+    raise ValueError(f"Unknown endpoint: {endpoint}")
+
+def outcome(response):
+    """"ok", or a short reason the request failed, including errors reported in a 200 body."""
+    if response.status_code != 200:
+        return f"http_{response.status_code}"
+    if response.headers.get("content-type", "").startswith("application/x-ndjson"):
+        last = json.loads(response.text.strip().splitlines()[-1])
+        return "ok" if last.get("event") in ("result", "done") else "error_event"
+    return "error_body" if "error" in response.json() else "ok"
+
+async def run_load(client, endpoint, images, concurrency, total, warmup, batch_size=3):
+    latencies = []
+    outcomes = {}
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index
+        while next_index < warmup + total:
+            i = next_index
+            next_index += 1
+            path, body = build_request(endpoint, images, i, batch_size)
+            started = time.perf_counter()
+            try:
+                response = await client.post(path, json=body)
+                result = outcome(response)
+            except (httpx.HTTPError, ValueError) as e:
+                result = e.__class__.__name__
+            if i < warmup:
+                continue
+            latencies.append(time.perf_counter() - started)
+            outcomes[result] = outcomes.get(result, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, outcomes, time.perf_counter() - started
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[rank]
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def build_report(args, latencies, outcomes, elapsed):
+    values = sorted(latencies)
+    return {
+        "endpoint": args.endpoint,
+        "concurrency": args.concurrency,
+        "requests": len(values),
+        "outcomes": outcomes,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+        "latency_s": {
+            "mean": round(sum(values) / len(values), 4) if values else 0.0,
+            "p50": round(percentile(values, 50), 4),
+            "p95": round(percentile(values, 95), 4),
+            "p99": round(percentile(values, 99), 4),
+            "max": round(values[-1], 4) if values else 0.0,
+        },
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+def print_report(report):
+    latency = report["latency_s"]
+    print(f"\n{report['requests']} x {report['endpoint']} at concurrency {report['concurrency']} "
+          f"in {report['elapsed_s']:.2f}s")
+    print(f"  throughput  {report['throughput_rps']:.2f} req/s")
+    print(f"  latency     mean {latency['mean']:.3f}s  p50 {latency['p50']:.3f}s  p95 {latency['p95']:.3f}s  "
+          f"p99 {latency['p99']:.3f}s  max {latency['max']:.3f}s")
+    print(f"  outcomes    {', '.join(f'{name}={count}' for name, count in sorted(report['outcomes'].items()))}")
+    print(f"  peak RSS    {report['peak_rss_mb']:.1f} MB")
+
+async def main(args):
+    images = make_images(args.images, args.seed) if args.endpoint.startswith("analyze") else []
+    timeout = httpx.Timeout(args.timeout)
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=timeout) as client:
+            return await run_load(client, args.endpoint, images, args.concurrency, args.requests, args.warmup,
+                                  args.batch_size)
+
+    import app as app_module
+
+    fastapi_app = fakes.install_fakes(
+        app_module,
+        image_latency=args.image_latency,
+        model_latency=args.model_latency,
+        search_latency=args.search_latency,
+        page_latency=args.page_latency,
+        model_failure_rate=args.model_failure_rate,
+        page_failure_rate=args.page_failure_rate,
+        time_scale=args.time_scale,
+        image_cache=args.image_cache,
+        seed=args.seed,
+    )
+    transport = httpx.ASGITransport(app=fastapi_app)
+    # The app logs every stage with print; keep the report readable unless asked otherwise
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+    async with fastapi_app.router.lifespan_context(fastapi_app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=timeout) as client:
+            with quiet:
+                return await run_load(client, args.endpoint, images, args.concurrency, args.requests, args.warmup,
+                                  args.batch_size)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoint", default="analyze", choices=["analyze", "analyze-stream", "analyze-batch", "chat", "chat-stream"])
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=0, help="requests sent first and left out of the report")
+    parser.add_argument("--url", help="load a running server instead of the in-process faked app")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--images", type=int, default=8, help="distinct photos cycled through")
+    parser.add_argument("--batch-size", type=int, default=3, help="photos per analyze-batch request")
+    parser.add_argument("--image-cache", action="store_true", help="let repeated photos hit the analysis cache")
+    parser.add_argument("--image-latency", default=fakes.DEFAULTS["image_latency"])
+    parser.add_argument("--model-latency", default=fakes.DEFAULTS["model_latency"])
+    parser.add_argument("--search-latency", default=fakes.DEFAULTS["search_latency"])
+    parser.add_argument("--page-latency", default=fakes.DEFAULTS["page_latency"])
+    parser.add_argument("--model-failure-rate", type=float, default=fakes.DEFAULTS["model_failure_rate"])
+    parser.add_argument("--page-failure-rate", type=float, default=fakes.DEFAULTS["page_failure_rate"])
+    parser.add_argument("--time-scale", type=float, default=1.0, help="multiply every simulated latency")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="also write the report to this file")
+    parser.add_argument("--verbose", action="store_true", help="show the app's logs")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    latencies, outcomes, elapsed = asyncio.run(main(args))
+    report = build_report(args, latencies, outcomes, elapsed)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,272 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import zendriver as nodriver
+
+
+class BrowserPoolExhausted(Exception):
+    """Raised when no browser tab frees up in time or too many callers are already waiting."""
+
+
+class _PooledBrowser:
+    def __init__(self, browser):
+        self.browser = browser
+        self.uses = 0
+        self.parked = 0
+        self.replacing = False
+        self.retiring = False
+
+
+class BrowserPool:
+    """
+    A long-lived, bounded pool of warm headless browsers, each with a fixed number of tabs.
+
+    Tabs are handed out with `async with pool.tab() as tab:`. A browser is recycled after
+    `max_uses` checkouts or when it fails a health check. Replacements are launched in the
+    background, and a worn browser keeps serving until its replacement is up, so no caller
+    waits for a cold start. Callers are turned away with BrowserPoolExhausted once every
+    tab is busy and the wait queue is full.
+
+    Args:
+        browsers (int): Number of browser processes to keep running.
+        tabs_per_browser (int): Number of tabs opened in each browser.
+        max_uses (int): Checkouts after which a browser is stopped and replaced.
+        acquire_timeout (float): Seconds a caller waits for a free tab before giving up.
+        max_waiters (int): Callers allowed to queue for a tab before new ones are rejected.
+        health_check_interval (float): Seconds between background checks that every browser
+            is running and answers on an idle tab.
+        headless (bool): Whether to launch browsers headless.
+    """
+
+    def __init__(self, browsers=1, tabs_per_browser=3, max_uses=100, acquire_timeout=15.0,
+                 max_waiters=20, health_check_interval=30.0, headless=True):
+        self.browsers = browsers
+        self.tabs_per_browser = tabs_per_browser
+        self.max_uses = max_uses
+        self.acquire_timeout = acquire_timeout
+        self.max_waiters = max_waiters
+        self.health_check_interval = health_check_interval
+        self.headless = headless
+        self._slots = []
+        self._idle = asyncio.Queue()
+        self._waiters = 0
+        self._pending_launches = 0
+        self._closed = True
+        self._health_task = None
+        self._background = set()
+
+    async def start(self):
+        self._closed = False
+        for _ in range(self.browsers):
+            await self._launch()
+        self._health_task = asyncio.create_task(self._health_loop())
+        print(f"Browser pool started with {self.browsers} browser(s) x {self.tabs_per_browser} tab(s)")
+
+    async def close(self):
+        self._closed = True
+        if self._health_task:
+            self._health_task.cancel()
+            self._health_task = None
+        # Let in-flight launches and stops finish so no browser process is left behind
+        await asyncio.gather(*self._background, return_exceptions=True)
+        while not self._idle.empty():
+            self._idle.get_nowait()
+        for slot in self._slots:
+            await self._stop_browser(slot)
+        self._slots.clear()
+        print("Browser pool stopped")
+
+    def stats(self):
+        return {
+            "browsers": len(self._slots),
+            "idle_tabs": self._idle.qsize(),
+            "waiters": self._waiters,
+        }
+
+    @asynccontextmanager
+    async def tab(self):
+        slot, tab = await self._acquire()
+        healthy = True
+        try:
+            yield tab
+        except Exception:
+            healthy = await self._is_healthy(slot, tab)
+            raise
+        finally:
+            await self._release(slot, tab, healthy)
+
+    async def _launch(self):
+        browser = await nodriver.start(headless=self.headless)
+        slot = _PooledBrowser(browser)
+        tabs = [await browser.get("about:blank")]
+        for _ in range(self.tabs_per_browser - 1):
+            tabs.append(await browser.get("about:blank", new_tab=True))
+        if self._closed:
+            await self._stop_browser(slot)
+            return
+        self._slots.append(slot)
+        for tab in tabs:
+            self._idle.put_nowait((slot, tab))
+
+    async def _acquire(self):
+        if self._closed:
+            raise BrowserPoolExhausted("Browser pool is not running")
+        while not self._idle.empty():
+            slot, tab = self._idle.get_nowait()
+            if slot.retiring or slot.browser.stopped:
+                self._discard(slot)
+                self._park(slot)
+                continue
+            slot.uses += 1
+            return slot, tab
+        if self._waiters >= self.max_waiters:
+            raise BrowserPoolExhausted(f"{self._waiters} requests already waiting for a browser tab")
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.acquire_timeout
+        self._waiters += 1
+        try:
+            while True:
+                remaining = deadline - loop.time()
+                try:
+                    slot, tab = await asyncio.wait_for(self._idle.get(), max(remaining, 0))
+                except asyncio.TimeoutError:
+                    raise BrowserPoolExhausted(
+                        f"No browser tab became free within {self.acquire_timeout}s"
+                    ) from None
+                if slot.retiring or slot.browser.stopped:
+                    self._discard(slot)
+                    self._park(slot)
+                    continue
+                slot.uses += 1
+                return slot, tab
+        finally:
+            self._waiters -= 1
+
+    async def _release(self, slot, tab, healthy):
+        if not healthy:
+            self._discard(slot)
+        elif slot.uses >= self.max_uses:
+            self._recycle(slot)
+        if slot.retiring or self._closed:
+            self._park(slot)
+        else:
+            self._idle.put_nowait((slot, tab))
+
+    def _recycle(self, slot):
+        """Launch a worn browser's replacement in the background; the old one keeps serving until it is up."""
+        if slot.replacing or slot.retiring or self._closed:
+            return
+        slot.replacing = True
+        self._spawn(self._replace(slot))
+
+    async def _replace(self, slot):
+        try:
+            await self._launch()
+        except Exception as e:
+            # Tried again when the old browser's next tab is released
+            print(f"Error launching replacement browser: {e}")
+            slot.replacing = False
+            return
+        print(f"Recycled browser after {slot.uses} uses")
+        slot.retiring = True
+        self._park_idle_tabs(slot)
+
+    def _discard(self, slot):
+        """Take a broken browser's tabs out of circulation at once and launch its replacement in the background."""
+        if slot.retiring:
+            return
+        slot.retiring = True
+        self._park_idle_tabs(slot)
+        if slot.replacing or self._closed:
+            return
+        slot.replacing = True
+        self._pending_launches += 1
+        self._spawn(self._relaunch())
+
+    async def _relaunch(self):
+        try:
+            await self._launch()
+        except Exception as e:
+            # The health loop tops the pool up again on its next pass
+            print(f"Error launching replacement browser: {e}")
+        finally:
+            self._pending_launches -= 1
+
+    def _park_idle_tabs(self, slot):
+        idle = []
+        while not self._idle.empty():
+            idle.append(self._idle.get_nowait())
+        for entry in idle:
+            if entry[0] is slot:
+                self._park(slot)
+            else:
+                self._idle.put_nowait(entry)
+
+    def _park(self, slot):
+        """Take one of a retiring browser's tabs out of circulation, stopping the browser once all are out."""
+        slot.parked += 1
+        if slot.parked < self.tabs_per_browser or slot not in self._slots:
+            return
+        self._slots.remove(slot)
+        self._spawn(self._stop_browser(slot))
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _is_healthy(self, slot, tab):
+        if slot.browser.stopped:
+            return False
+        try:
+            await asyncio.wait_for(tab.evaluate("1"), timeout=2)
+            return True
+        except Exception as e:
+            print(f"Browser tab failed health check: {e}")
+            return False
+
+    async def _stop_browser(self, slot):
+        try:
+            await slot.browser.stop()
+        except Exception as e:
+            print(f"Error stopping browser: {e}")
+
+    async def _probe_idle_tabs(self):
+        """Evaluate a script on one idle tab of each browser, so a hung browser is caught between requests."""
+        idle = []
+        while not self._idle.empty():
+            idle.append(self._idle.get_nowait())
+        probes = {}
+        for slot, tab in idle:
+            if slot not in probes and not slot.retiring:
+                probes[slot] = tab
+            else:
+                self._idle.put_nowait((slot, tab))
+        results = await asyncio.gather(*(self._is_healthy(slot, tab) for slot, tab in probes.items()))
+        for (slot, tab), healthy in zip(probes.items(), results):
+            if not healthy:
+                print("Browser stopped responding, replacing it")
+                self._discard(slot)
+            if slot.retiring or self._closed:
+                self._park(slot)
+            else:
+                self._idle.put_nowait((slot, tab))
+
+    async def _health_loop(self):
+        while not self._closed:
+            await asyncio.sleep(self.health_check_interval)
+            for slot in list(self._slots):
+                if slot.browser.stopped and not slot.retiring:
+                    print("Browser process died, replacing it")
+                    self._discard(slot)
+            await self._probe_idle_tabs()
+            live = sum(1 for slot in self._slots if not slot.retiring) + self._pending_launches
+            for _ in range(self.browsers - live):
+                if self._closed:
+                    break
+                try:
+                    await self._launch()
+                except Exception as e:
+                    print(f"Error launching browser during health check: {e}")
+                    break
@@ -0,0 +1,123 @@
+import math
+import re
+from collections import Counter
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset(
+    "a an and are as at be but by can for from has have how if in into is it its may of on or "
+    "that the their then there these this to was were what when which will with you your".split()
+)
+
+def tokenize(text):
+    return [word for word in TOKEN_RE.findall(text.lower()) if word not in STOPWORDS]
+
+def estimate_tokens(text):
+    """Rough model token count (about four characters per token) without a network round trip."""
+    return len(text) // 4 + 1
+
+def chunk_text(text, chunk_words=120):
+    words = text.split()
+    return [" ".join(words[i:i + chunk_words]) for i in range(0, len(words), chunk_words)]
+
+class BM25:
+    """Okapi BM25 scorer over a fixed list of tokenized documents."""
+
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_counts = [Counter(doc) for doc in documents]
+        self.lengths = [len(doc) for doc in documents]
+        self.avg_length = sum(self.lengths) / len(documents) if documents else 0
+        document_frequency = Counter(term for doc in self.term_counts for term in doc)
+        n = len(documents)
+        self.idf = {
+            term: math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for term, df in document_frequency.items()
+        }
+
+    def scores(self, query_tokens):
+        query_terms = set(query_tokens)
+        results = []
+        for counts, length in zip(self.term_counts, self.lengths):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * length / self.avg_length) if self.avg_length else self.k1
+            for term in query_terms:
+                tf = counts.get(term)
+                if tf:
+                    score += self.idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            results.append(score)
+        return results
+
+def select_passages(page_contents, query, token_budget=6000, chunk_words=120):
+    """
+    Select the passages of the scraped pages most relevant to `query` that fit in `token_budget`.
+
+    Pages are split into chunks, duplicate chunks (shared boilerplate) are dropped, chunks are
+    ranked with BM25 against the query and packed best-first until the budget is used.
+
+    Returns:
+        tuple: (passages, stats) where passages maps each URL with selected chunks to those
+        chunks in their original order, joined with " ... ", and stats reports total, used and
+        saved token estimates.
+    """
+    chunks = []  # (url, position, text)
+    seen = set()
+    for url, text in page_contents.items():
+        for position, chunk in enumerate(chunk_text(text or "", chunk_words)):
+            if chunk not in seen:
+                seen.add(chunk)
+                chunks.append((url, position, chunk))
+
+    total_tokens = sum(estimate_tokens(text) for text in page_contents.values() if text)
+    if chunks:
+        scores = BM25([tokenize(chunk) for _, _, chunk in chunks]).scores(tokenize(query))
+    else:
+        scores = []
+    # Best chunks first; ties (e.g. nothing matched) fall back to page order
+    ranked = sorted(range(len(chunks)), key=lambda i: (-scores[i], chunks[i][1]))
+
+    selected = []
+    used_tokens = 0
+    for i in ranked:
+        cost = estimate_tokens(chunks[i][2])
+        if used_tokens + cost > token_budget:
+            continue
+        selected.append(i)
+        used_tokens += cost
+
+    by_url = {}
+    for i in sorted(selected):
+        url, _, chunk = chunks[i]
+        by_url.setdefault(url, []).append(chunk)
+    passages = {url: " ... ".join(parts) for url, parts in by_url.items()}
+
+    stats = {
+        "chunks_total": len(chunks),
+        "chunks_used": len(selected),
+        "tokens_total": total_tokens,
+        "tokens_used": used_tokens,
+        "tokens_saved": max(total_tokens - used_tokens, 0),
+    }
+    return passages, stats
+
+def build_context(page_contents, query, token_budget=6000, chunk_words=120):
+    """
+    Pack the passages of the scraped pages most relevant to `query` into prompt text.
+
+    The passages chosen by select_passages are returned grouped by page, each page headed by
+    its URL.
+
+    Args:
+        page_contents (dict): Extracted text keyed by URL.
+        query (str): Text to rank against, e.g. the image description and search query.
+        token_budget (int): Estimated tokens allowed for the packed context.
+        chunk_words (int): Words per chunk.
+
+    Returns:
+        tuple: (context, stats) where context is the text for the prompt and stats reports
+        total, used and saved token estimates.
+    """
+    passages, stats = select_passages(page_contents, query, token_budget, chunk_words)
+    context = "\n\n".join(f"[Source: {url}]\n{text}" for url, text in passages.items())
+    return context, stats
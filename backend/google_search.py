@@ -1,11 +1,45 @@
-from bs4 import BeautifulSoup
 import zendriver as nodriver
 import asyncio
 
+from browser_pool import BrowserPoolExhausted
+from serp_parser import parse_serp
+import telemetry
+
+# Set by the app at startup; when None each search launches its own browser
+_browser_pool = None
+# Set by the app at startup; when None every call searches again
+_search_cache = None
+
+def set_browser_pool(pool):
+    global _browser_pool
+    _browser_pool = pool
+
+def set_search_cache(cache):
+    global _search_cache
+    _search_cache = cache
+
+async def _fetch_with_browser(url):
+    if _browser_pool is not None:
+        async with _browser_pool.tab() as tab:
+            await tab.get(url)
+            await asyncio.sleep(4)  # Wait for the page to load
+            return await tab.get_content()
+
+    browser = await nodriver.start(headless=True)
+    try:
+        tab = await browser.get(url)
+        await asyncio.sleep(4)  # Wait for the page to load
+        return await tab.get_content()
+    finally:
+        try:
+            await browser.stop()
+        except Exception as e:
+            print(f"Error stopping browser: {e}")
+
 async def google_search(query):
-    print("Entering google_search function")
     """
-    Performs a Google search using nodriver and BeautifulSoup4 to extract the page title, link, and blurb for each result.
+    Performs a Google search using nodriver and serp_parser to extract the page title, link, and blurb for each result.
+    Results are served from the search cache when one is configured.
 
     Args:
         query (str): The search query.
@@ -13,62 +47,39 @@ async def google_search(query):
     Returns:
         list: A list of dictionaries, where each dictionary contains the title, link, and blurb of a search result.
     """
-    try:
-        # Initialize nodriver
-        browser = await nodriver.start(headless=True)
+    if _search_cache is not None:
+        return await _search_cache.get_or_fetch(query, _search)
+    return await _search(query)
 
+async def _search(query):
+    print("Entering google_search function")
+    try:
         # Construct the Google search URL
         url = f"https://www.google.com/search?q={query}"
 
-        # Fetch the Google search page using nodriver
-        tab = await browser.get(url)
-        await asyncio.sleep(4)  # Wait for the page to load
-        # Get the page source
-        page_source = await tab.get_content()
+        # Fetch the Google search page using a pooled tab, or a fresh browser without a pool
+        with telemetry.span("serp_fetch", pooled=_browser_pool is not None):
+            page_source = await _fetch_with_browser(url)
         # print(page_source)
 
         if page_source is None:
             print("Error: Could not retrieve page source using nodriver.")
-            if 'browser' in locals():
-                await browser.stop()
             return []
 
         # print(f"Page source: {page_source[:500]}...")  # Print first 500 characters
 
-        # Parse the HTML content with BeautifulSoup4
-        soup = BeautifulSoup(page_source, "html.parser")
-        # print(f"Soup: {soup.prettify()[:500]}...") # Print first 500 characters of prettified soup
-
-        # Locate result elements using the correct CSS selector
-        result_elements = soup.select(".g") # broader selector
-        # print(f"Result elements: {result_elements}")
-
-        results = []
-        for result_element in result_elements:
-            try:
-                title_element = result_element.select_one("h3") # broader selector
-                link_element = result_element.select_one("a") # broader selector
-                blurb_element = result_element.select_one("div.VwiC3b.yXK7lf.p4wth.r025kc.hJNv6b.Hdw6tb") # broader selector
-
-                title = title_element.text if title_element else ""
-                link = link_element["href"] if link_element and "href" in link_element.attrs else ""
-                blurb = blurb_element.text if blurb_element else ""
-
-                results.append({"title": title, "link": link, "blurb": blurb})
-            except Exception as e:
-                print(f"Error extracting data from result element: {e}")
-
+        with telemetry.span("serp_parse", chars=len(page_source)) as span:
+            results = parse_serp(page_source)
+            span.set(results=len(results))
+        print(f"Parsed {len(results)} search results")
         return results
 
+    except BrowserPoolExhausted:
+        # Let the caller shed load instead of treating a full pool as "no results"
+        raise
     except Exception as e:
         print(f"Request failed: {e}")
         return []
-    finally:
-        if 'browser' in locals():
-            try:
-                await browser.stop()
-            except Exception as e:
-                print(f"Error stopping browser: {e}")
 
 # Example usage
 if __name__ == "__main__":
@@ -0,0 +1,172 @@
+import re
+
+from bs4 import BeautifulSoup
+
+# C-backed parsers are optional; the fastest one installed is used by default
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+try:
+    import lxml.html
+    from lxml import etree
+except ImportError:
+    lxml = None
+
+# Elements that never hold the article itself
+BOILERPLATE_TAGS = ["script", "style", "noscript", "template", "svg", "iframe", "nav", "header", "footer", "aside", "form", "button"]
+BOILERPLATE_ROLES = ["navigation", "banner", "contentinfo", "dialog", "alertdialog", "search"]
+# id/class fragments of small page furniture such as cookie banners and share bars
+BOILERPLATE_HINTS = ("cookie", "consent", "newsletter", "subscribe", "breadcrumb", "social", "share", "advert", "promo", "popup", "modal")
+# Blocks matching a hint are only dropped when they are this short and hold no <main>/<article>,
+# so a page wrapped in e.g. "share-root" survives if it is long or marks up its article
+BOILERPLATE_MAX_CHARS = 1000
+MAIN_SELECTOR = 'main, [role="main"], article'
+# A <main>/<article> with less text than this is probably a teaser, so the whole body is used instead
+MIN_MAIN_CHARS = 200
+
+WHITESPACE_RE = re.compile(r"\s+")
+
+def _hint_selector():
+    return ", ".join(f"[id*={hint} i], [class*={hint} i]" for hint in BOILERPLATE_HINTS)
+
+def _role_selector():
+    return ", ".join(f'[role="{role}"]' for role in BOILERPLATE_ROLES)
+
+def _extract_selectolax(html):
+    tree = LexborHTMLParser(html)
+    body = tree.body
+    if body is None:
+        return ""
+    # Drop whole subtrees before any text is walked
+    tree.strip_tags(BOILERPLATE_TAGS)
+    doomed = body.css(_role_selector()) + [
+        node for node in body.css(_hint_selector())
+        # css() matches the body itself, which the other parsers never consider
+        if node.tag not in ("body", "html")
+        and node.css_first(MAIN_SELECTOR) is None
+        and len(node.text(strip=True)) < BOILERPLATE_MAX_CHARS
+    ]
+    # Only decompose the outermost matches; nested ones go with their ancestor
+    doomed_ids = {node.mem_id for node in doomed}
+    for node in doomed:
+        parent = node.parent
+        while parent is not None and parent.mem_id not in doomed_ids:
+            parent = parent.parent
+        if parent is None:
+            node.decompose()
+    main = body.css_first(MAIN_SELECTOR)
+    if main is not None and len(main.text(strip=True)) > MIN_MAIN_CHARS:
+        body = main
+    return WHITESPACE_RE.sub(" ", body.text(separator=" ", strip=True)).strip()
+
+def _lxml_text(element):
+    return " ".join(part.strip() for part in element.itertext() if part.strip())
+
+def _lxml_drop(element):
+    # drop_tree glues the tail onto the preceding text, so keep a word break the other parsers would see
+    if element.tail:
+        element.tail = " " + element.tail
+    element.drop_tree()
+
+_LXML_MAIN_XPATH = 'descendant-or-self::*[self::main or self::article or @role="main"]'
+
+def _extract_lxml(html):
+    parser = lxml.html.HTMLParser(remove_comments=True, remove_pis=True)
+    try:
+        doc = lxml.html.document_fromstring(html, parser=parser)
+    except (etree.ParserError, ValueError):
+        return ""
+    body = doc.find("body")
+    if body is None:
+        return ""
+    for element in list(body.iter(*BOILERPLATE_TAGS)):
+        _lxml_drop(element)
+    role_test = " or ".join(f'@role="{role}"' for role in BOILERPLATE_ROLES)
+    for element in body.xpath(f".//*[{role_test}]"):
+        _lxml_drop(element)
+    hint_test = " or ".join(
+        f'contains(translate(@id, "ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz"), "{hint}") or '
+        f'contains(translate(@class, "ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz"), "{hint}")'
+        for hint in BOILERPLATE_HINTS
+    )
+    for element in body.xpath(f".//*[{hint_test}]"):
+        if element.getparent() is None or element.xpath(_LXML_MAIN_XPATH):
+            continue
+        if len(_lxml_text(element)) < BOILERPLATE_MAX_CHARS:
+            _lxml_drop(element)
+    main = body.find(".//main")
+    if main is None:
+        candidates = body.xpath('.//*[@role="main"] | .//article')
+        main = candidates[0] if candidates else None
+    if main is not None and len(_lxml_text(main)) > MIN_MAIN_CHARS:
+        body = main
+    return _lxml_text(body)
+
+def _is_main(tag):
+    return tag.name in ("main", "article") or tag.get("role") == "main"
+
+def _is_boilerplate_block(tag):
+    attributes = " ".join([tag.get("id") or ""] + list(tag.get("class") or [])).lower()
+    if not any(hint in attributes for hint in BOILERPLATE_HINTS):
+        return False
+    if _is_main(tag) or tag.find(_is_main) is not None:
+        return False
+    return len(tag.get_text(strip=True)) < BOILERPLATE_MAX_CHARS
+
+def _extract_bs4(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    body = soup.find('body')
+    if body is None:
+        # html.parser doesn't add the <body> the other parsers imply, so use everything outside <head>
+        for tag in soup.find_all(['head', 'title']):
+            tag.decompose()
+        body = soup
+    boilerplate = body.find_all(BOILERPLATE_TAGS) + body.find_all(attrs={"role": BOILERPLATE_ROLES})
+    boilerplate += body.find_all(lambda tag: (tag.get("id") or tag.get("class")) and _is_boilerplate_block(tag))
+    for tag in boilerplate:
+        if not tag.decomposed:
+            tag.decompose()
+
+    main = body.find('main') or body.find(attrs={"role": "main"}) or body.find('article')
+    if main is not None and len(main.get_text(strip=True)) > MIN_MAIN_CHARS:
+        body = main
+    return body.get_text(separator=' ', strip=True)
+
+BACKENDS = {}
+if LexborHTMLParser is not None:
+    BACKENDS["selectolax"] = _extract_selectolax
+if lxml is not None:
+    BACKENDS["lxml"] = _extract_lxml
+BACKENDS["html.parser"] = _extract_bs4
+
+_default_backend = next(iter(BACKENDS))
+
+def set_default_backend(backend):
+    """Choose the parser used by extract_main_text; falls back to the fastest installed one."""
+    global _default_backend
+    if backend and backend not in BACKENDS:
+        print(f"HTML parser {backend} is not installed, using {next(iter(BACKENDS))}")
+        backend = None
+    _default_backend = backend or next(iter(BACKENDS))
+
+def extract_main_text(html, backend=None):
+    """
+    Return the main readable text of a page, without navigation, footers, scripts and banners.
+
+    Boilerplate subtrees are removed before any text is collected, and a <main>/<article>
+    element is preferred when it holds real content.
+
+    Args:
+        html (str): The page source.
+        backend (str): One of BACKENDS; defaults to the fastest installed parser.
+    """
+    return BACKENDS[backend or _default_backend](html)
+
+def soup_features():
+    """The fastest BeautifulSoup tree builder available, for code that needs CSS selectors on a soup."""
+    return "lxml" if lxml is not None else "html.parser"
+
+def make_soup(html):
+    return BeautifulSoup(html, soup_features())
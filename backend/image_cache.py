@@ -0,0 +1,149 @@
+import hashlib
+import time
+from collections import OrderedDict
+
+from PIL import Image
+
+def dhash(image, hash_size=8):
+    """
+    Difference hash of a PIL image: a 64-bit int that changes little when the photo is
+    re-taken, re-compressed or slightly resized, so near-duplicates have a small Hamming distance.
+    """
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+def fingerprint(prepared_image):
+    """Return (exact hash, perceptual hash) for a PreparedImage."""
+    return hashlib.sha256(prepared_image.data).hexdigest(), dhash(prepared_image.image)
+
+class BKTree:
+    """
+    Burkhard-Keller tree over perceptual hashes for Hamming-distance range queries that only
+    visit a small part of the tree. Removal is lazy; the tree is rebuilt once half of it is stale.
+    """
+
+    def __init__(self):
+        self._root = None  # [hash, keys, {distance: child}]
+        self._size = 0
+        self._removed = set()
+
+    def add(self, value, key):
+        self._size += 1
+        self._removed.discard(key)
+        if self._root is None:
+            self._root = [value, {key}, {}]
+            return
+        node = self._root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].add(key)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, {key}, {}]
+                return
+            node = child
+
+    def remove(self, key):
+        self._removed.add(key)
+        if len(self._removed) * 2 > self._size:
+            self._rebuild()
+
+    def search(self, value, max_distance):
+        """Return (distance, key) pairs within `max_distance` of `value`, nearest first."""
+        matches = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= max_distance:
+                matches.extend((distance, key) for key in node[1] if key not in self._removed)
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        return sorted(matches)
+
+    def _rebuild(self):
+        entries = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            entries.extend((node[0], key) for key in node[1] if key not in self._removed)
+            stack.extend(node[2].values())
+        self._root, self._size, self._removed = None, 0, set()
+        for value, key in entries:
+            self.add(value, key)
+
+class ImageResultCache:
+    """
+    LRU cache of /analyze results keyed on the exact image hash, with near-duplicate lookup by
+    perceptual hash so a re-taken photo of the same injury reuses the earlier analysis.
+
+    Args:
+        max_entries (int): Results kept before the least recently used is evicted.
+        ttl (float): Seconds a result stays valid.
+        max_distance (int): Largest dHash Hamming distance (out of 64) treated as the same photo.
+    """
+
+    def __init__(self, max_entries=1024, ttl=24 * 3600, max_distance=6):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self._entries = OrderedDict()  # exact hash -> (stored_at, perceptual hash, result)
+        self._index = BKTree()
+        self.counters = {"exact_hits": 0, "similar_hits": 0, "misses": 0}
+
+    def get(self, exact_hash, perceptual_hash):
+        """
+        Returns:
+            tuple: (result, match) where match is "exact" or "similar", or (None, None) on a miss.
+        """
+        result = self._fresh(exact_hash)
+        if result is not None:
+            self.counters["exact_hits"] += 1
+            return result, "exact"
+        for _, key in self._index.search(perceptual_hash, self.max_distance):
+            result = self._fresh(key)
+            if result is not None:
+                self.counters["similar_hits"] += 1
+                return result, "similar"
+        self.counters["misses"] += 1
+        return None, None
+
+    def put(self, exact_hash, perceptual_hash, result):
+        if exact_hash in self._entries:
+            self._drop(exact_hash)
+        self._entries[exact_hash] = (time.time(), perceptual_hash, result)
+        self._index.add(perceptual_hash, exact_hash)
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+
+    def stats(self):
+        lookups = sum(self.counters.values())
+        hits = self.counters["exact_hits"] + self.counters["similar_hits"]
+        return {**self.counters, "entries": len(self._entries), "hit_rate": hits / lookups if lookups else 0.0}
+
+    def _fresh(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry[0] > self.ttl:
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry[2]
+
+    def _drop(self, key):
+        del self._entries[key]
+        self._index.remove(key)
@@ -0,0 +1,80 @@
+import asyncio
+import io
+
+from PIL import Image, ImageOps
+
+# Largest upload accepted, checked before anything is decoded
+MAX_UPLOAD_BYTES = 15 * 1024 * 1024
+# Largest decoded image accepted, guarding against decompression bombs
+MAX_IMAGE_PIXELS = 50_000_000
+# Longest side sent to the model; larger photos only add upload time and cost
+MAX_IMAGE_SIDE = 1536
+JPEG_QUALITY = 85
+
+class ImageTooLarge(ValueError):
+    pass
+
+class PreparedImage:
+    """A downsized, metadata-free JPEG ready to send to the model, plus the decoded PIL image."""
+
+    def __init__(self, data, image, original_size, original_bytes):
+        self.data = data
+        self.image = image
+        self.original_size = original_size
+        self.original_bytes = original_bytes
+        self.mime_type = "image/jpeg"
+
+    def as_part(self):
+        # Passing the encoded bytes stops the SDK from re-encoding the PIL image
+        return {"mime_type": self.mime_type, "data": self.data}
+
+def estimated_base64_size(base64_str):
+    return len(base64_str) * 3 // 4
+
+def check_upload_size(size, max_bytes=MAX_UPLOAD_BYTES):
+    if size > max_bytes:
+        raise ImageTooLarge(f"Image is {size} bytes, the limit is {max_bytes} bytes")
+
+def preprocess_image(image_data, max_side=MAX_IMAGE_SIDE, quality=JPEG_QUALITY,
+                     max_bytes=MAX_UPLOAD_BYTES, max_pixels=MAX_IMAGE_PIXELS):
+    """
+    Decode an uploaded image, apply its EXIF orientation, cap its resolution and re-encode it as
+    a JPEG without metadata.
+
+    Args:
+        image_data (bytes): The raw uploaded file.
+        max_side (int): Longest side of the output in pixels.
+        quality (int): JPEG quality of the output.
+        max_bytes (int): Largest accepted upload in bytes.
+        max_pixels (int): Largest accepted image in pixels.
+
+    Returns:
+        PreparedImage: The re-encoded image.
+    """
+    check_upload_size(len(image_data), max_bytes)
+    img = Image.open(io.BytesIO(image_data))
+    original_size = img.size
+    if img.width * img.height > max_pixels:
+        raise ImageTooLarge(f"Image is {img.width}x{img.height}, the limit is {max_pixels} pixels")
+
+    # Let the JPEG decoder downscale by a power of two while decoding, which is much cheaper
+    img.draft("RGB", (max_side, max_side))
+    img = ImageOps.exif_transpose(img)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    img.thumbnail((max_side, max_side), Image.LANCZOS)
+
+    # A fresh save without exif/icc arguments drops all metadata, including location
+    output = io.BytesIO()
+    img.save(output, format="JPEG", quality=quality, optimize=True)
+    return PreparedImage(output.getvalue(), img, original_size, len(image_data))
+
+def load_prepared(data):
+    """Decode a JPEG produced earlier by preprocess_image, e.g. a queued job's payload, without re-encoding it."""
+    img = Image.open(io.BytesIO(data))
+    img.load()
+    return PreparedImage(data, img, img.size, len(data))
+
+async def prepare_image(image_data, **options):
+    """Run preprocess_image in a worker thread so decoding and resizing don't block the event loop."""
+    return await asyncio.to_thread(preprocess_image, image_data, **options)
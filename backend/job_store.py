@@ -0,0 +1,259 @@
+import json
+import secrets
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+
+# Job states: queued -> running -> done | failed; running jobs whose worker died go back to queued
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+class JobStore(ABC):
+    """
+    Queue and result storage for background /analyze jobs.
+
+    A job carries an opaque `payload` (the prepared image) until a worker claims it, then the
+    latest pipeline `stage` while it runs and finally a `result` or an `error`. Finished jobs
+    expire `ttl` seconds after they were last updated.
+    """
+
+    def __init__(self, ttl=3600):
+        self.ttl = ttl
+
+    @abstractmethod
+    def submit(self, payload):
+        """Queue a job and return its ID."""
+
+    @abstractmethod
+    def claim(self):
+        """Mark the oldest queued job as running and return (job_id, payload), or None."""
+
+    @abstractmethod
+    def update(self, job_id, **fields):
+        """Set any of status, stage, result and error, refreshing the job's heartbeat."""
+
+    @abstractmethod
+    def get(self, job_id):
+        """Return the job as a dict without its payload, or None if it does not exist or has expired."""
+
+    @abstractmethod
+    def queued_count(self):
+        pass
+
+    @abstractmethod
+    def queued_bytes(self):
+        """Total size of the payloads still waiting for a worker."""
+
+    @abstractmethod
+    def requeue_stale(self, stale_after, max_attempts):
+        """
+        Requeue running jobs that haven't reported progress for `stale_after` seconds, e.g.
+        because their worker process died, or fail them after `max_attempts` claims.
+        """
+
+    @abstractmethod
+    def delete_expired(self):
+        pass
+
+    def close(self):
+        pass
+
+    @staticmethod
+    def _new_id():
+        return secrets.token_urlsafe(12)
+
+class InMemoryJobStore(JobStore):
+    """Job store for a single process; jobs are lost on restart."""
+
+    def __init__(self, ttl=3600):
+        super().__init__(ttl)
+        self._jobs = {}
+        self._payloads = {}
+        self._queue = deque()
+        self._lock = threading.Lock()
+
+    def submit(self, payload):
+        job_id = self._new_id()
+        now = time.time()
+        with self._lock:
+            self._jobs[job_id] = {
+                "job_id": job_id, "status": QUEUED, "stage": None, "result": None, "error": None,
+                "attempts": 0, "created_at": now, "updated_at": now,
+            }
+            self._payloads[job_id] = payload
+            self._queue.append(job_id)
+        return job_id
+
+    def claim(self):
+        with self._lock:
+            while self._queue:
+                job_id = self._queue.popleft()
+                job = self._jobs.get(job_id)
+                if job is None or job["status"] != QUEUED:
+                    continue
+                job.update(status=RUNNING, attempts=job["attempts"] + 1, updated_at=time.time())
+                return job_id, self._payloads[job_id]
+        return None
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.update(fields, updated_at=time.time())
+            if fields.get("status") == QUEUED:
+                self._queue.append(job_id)
+            elif fields.get("status") in (DONE, FAILED):
+                self._payloads.pop(job_id, None)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or self._expired(job):
+                return None
+            return dict(job)
+
+    def queued_count(self):
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job["status"] == QUEUED)
+
+    def queued_bytes(self):
+        with self._lock:
+            return sum(
+                len(self._payloads[job_id]) for job_id, job in self._jobs.items()
+                if job["status"] == QUEUED and job_id in self._payloads
+            )
+
+    def requeue_stale(self, stale_after, max_attempts):
+        cutoff = time.time() - stale_after
+        with self._lock:
+            for job_id, job in self._jobs.items():
+                if job["status"] == RUNNING and job["updated_at"] < cutoff:
+                    if job["attempts"] >= max_attempts:
+                        job.update(status=FAILED, error="Job worker stopped responding", updated_at=time.time())
+                        self._payloads.pop(job_id, None)
+                    else:
+                        job.update(status=QUEUED, updated_at=time.time())
+                        self._queue.append(job_id)
+
+    def delete_expired(self):
+        with self._lock:
+            for job_id in [job_id for job_id, job in self._jobs.items() if self._expired(job)]:
+                del self._jobs[job_id]
+                self._payloads.pop(job_id, None)
+
+    def _expired(self, job):
+        return job["status"] in (DONE, FAILED) and time.time() - job["updated_at"] > self.ttl
+
+class SQLiteJobStore(JobStore):
+    """
+    Job store backed by SQLite, so jobs survive restarts and can be claimed by worker processes
+    running `job_worker.py` alongside the API.
+    """
+
+    def __init__(self, db_path, ttl=3600):
+        super().__init__(ttl)
+        self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=5)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, status TEXT, stage TEXT, payload BLOB, "
+            "result TEXT, error TEXT, attempts INTEGER DEFAULT 0, created_at REAL, updated_at REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+        self._db.commit()
+        self._lock = threading.Lock()
+
+    def submit(self, payload):
+        job_id = self._new_id()
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, status, payload, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, QUEUED, payload, now, now),
+            )
+            self._db.commit()
+        return job_id
+
+    def claim(self):
+        with self._lock:
+            # A single UPDATE is atomic, so two worker processes never claim the same job
+            row = self._db.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ? "
+                "WHERE id = (SELECT id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1) "
+                "RETURNING id, payload",
+                (RUNNING, time.time(), QUEUED),
+            ).fetchone()
+            self._db.commit()
+        return (row[0], row[1]) if row else None
+
+    def update(self, job_id, **fields):
+        columns = {key: value for key, value in fields.items() if key in ("status", "stage", "result", "error")}
+        if "result" in columns:
+            columns["result"] = json.dumps(columns["result"])
+        if columns.get("status") in (DONE, FAILED):
+            columns["payload"] = None
+        assignments = ", ".join(f"{column} = ?" for column in columns)
+        with self._lock:
+            self._db.execute(
+                f"UPDATE jobs SET {assignments}{', ' if assignments else ''}updated_at = ? WHERE id = ?",
+                (*columns.values(), time.time(), job_id),
+            )
+            self._db.commit()
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, status, stage, result, error, attempts, created_at, updated_at FROM jobs "
+                "WHERE id = ? AND NOT (status IN (?, ?) AND updated_at < ?)",
+                (job_id, DONE, FAILED, time.time() - self.ttl),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "job_id": row[0], "status": row[1], "stage": row[2],
+            "result": json.loads(row[3]) if row[3] else None, "error": row[4],
+            "attempts": row[5], "created_at": row[6], "updated_at": row[7],
+        }
+
+    def queued_count(self):
+        with self._lock:
+            return self._db.execute("SELECT count(*) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+
+    def queued_bytes(self):
+        with self._lock:
+            return self._db.execute(
+                "SELECT coalesce(sum(length(payload)), 0) FROM jobs WHERE status = ?", (QUEUED,)
+            ).fetchone()[0]
+
+    def requeue_stale(self, stale_after, max_attempts):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, error = ?, payload = NULL, updated_at = ? "
+                "WHERE status = ? AND updated_at < ? AND attempts >= ?",
+                (FAILED, "Job worker stopped responding", now, RUNNING, now - stale_after, max_attempts),
+            )
+            self._db.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE status = ? AND updated_at < ?",
+                (QUEUED, now, RUNNING, now - stale_after),
+            )
+            self._db.commit()
+
+    def delete_expired(self):
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+                (DONE, FAILED, time.time() - self.ttl),
+            )
+            self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+def create_job_store(backend="memory", db_path="jobs.db", ttl=3600):
+    if backend == "sqlite":
+        return SQLiteJobStore(db_path, ttl=ttl)
+    if backend == "memory":
+        return InMemoryJobStore(ttl=ttl)
+    raise ValueError(f"Unknown job store backend: {backend}")
@@ -0,0 +1,104 @@
+import argparse
+import asyncio
+import signal
+
+class JobWorkerPool:
+    """
+    Runs jobs claimed from a JobStore on `concurrency` asyncio workers.
+
+    Idle workers poll the store every `poll_interval` seconds, or wake at once when `notify` is
+    called after a submit in the same process. Running jobs that stop reporting progress for
+    `stale_after` seconds, e.g. because their process died, are requeued by a reaper task.
+
+    Args:
+        store (JobStore): Where jobs are claimed from.
+        run (callable): Coroutine function `run(job_id, payload)` that runs one job and records
+            its outcome in the store.
+        concurrency (int): Jobs run at once by this pool.
+        poll_interval (float): Seconds between store polls while idle.
+        stale_after (float): Seconds without progress before a running job is requeued.
+        max_attempts (int): Claims after which a stale job is failed instead of requeued.
+    """
+
+    def __init__(self, store, run, concurrency=2, poll_interval=1.0, stale_after=300.0, max_attempts=3):
+        self.store = store
+        self.run = run
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+        self._wakeup = asyncio.Event()
+        self._tasks = []
+        self.counters = {"started": 0, "finished": 0, "running": 0}
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        self._tasks.append(asyncio.create_task(self._reap_stale()))
+
+    def notify(self):
+        self._wakeup.set()
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self):
+        while True:
+            try:
+                claimed = self.store.claim()
+            except Exception as e:
+                print(f"Error claiming job: {e}")
+                claimed = None
+            if claimed is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            job_id, payload = claimed
+            self.counters["started"] += 1
+            self.counters["running"] += 1
+            try:
+                await self.run(job_id, payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Job {job_id} crashed: {e}")
+            finally:
+                self.counters["running"] -= 1
+                self.counters["finished"] += 1
+
+    async def _reap_stale(self):
+        while True:
+            await asyncio.sleep(max(self.stale_after / 4, 1))
+            try:
+                self.store.requeue_stale(self.stale_after, self.max_attempts)
+            except Exception as e:
+                print(f"Error requeueing stale jobs: {e}")
+
+# Run analyze jobs in a separate process, sharing the API's SQLite job and session stores:
+#   JOB_STORE=sqlite SESSION_STORE=sqlite python job_worker.py --concurrency 4
+# Start several of these to spread image decoding and page parsing across cores.
+async def main(concurrency):
+    import app
+
+    if app.JOB_STORE_BACKEND != "sqlite":
+        print("Warning: JOB_STORE is not sqlite, so this worker cannot see jobs submitted to the API")
+    app.JOB_WORKERS = concurrency
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    async with app.lifespan(app.app):
+        print(f"Job worker running {concurrency} jobs at a time")
+        await stop.wait()
+    print("Job worker stopped")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run queued /jobs/analyze jobs outside the API process.")
+    parser.add_argument("--concurrency", type=int, default=2)
+    asyncio.run(main(parser.parse_args().concurrency))
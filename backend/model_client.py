@@ -0,0 +1,124 @@
+import asyncio
+import random
+
+from google.api_core import exceptions as api_exceptions
+
+import telemetry
+
+# Errors worth retrying after a pause: rate limiting and transient server overload
+RETRYABLE_ERRORS = (
+    api_exceptions.ResourceExhausted,
+    api_exceptions.TooManyRequests,
+    api_exceptions.ServiceUnavailable,
+    api_exceptions.InternalServerError,
+)
+
+class ModelClient:
+    """
+    Non-blocking access to Gemini models shared by every endpoint.
+
+    Calls go through `generate_content_async`, so a slow model call never blocks the event loop.
+    A global semaphore caps calls in flight, each attempt gets a timeout, and rate-limit errors
+    are retried with full-jitter exponential backoff.
+
+    Args:
+        max_concurrency (int): Model calls allowed in flight across all requests.
+        timeout (float): Seconds allowed for a single attempt.
+        max_retries (int): Retries after the first attempt on retryable errors.
+        base_delay (float): Backoff ceiling in seconds for the first retry, doubled each retry.
+        max_delay (float): Largest backoff ceiling in seconds.
+    """
+
+    def __init__(self, max_concurrency=8, timeout=60.0, max_retries=3, base_delay=1.0, max_delay=20.0):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._limit = asyncio.Semaphore(max_concurrency)
+
+    async def generate(self, model, contents, timeout=None):
+        """
+        Call `model.generate_content_async(contents)` under the concurrency limit.
+
+        Args:
+            model (genai.GenerativeModel): The model to call.
+            contents: A prompt string or a list of prompt parts (text, PIL images).
+            timeout (float): Overrides the per-attempt timeout for this call.
+
+        Returns:
+            GenerateContentResponse: The model response.
+        """
+        attempt = 0
+        while True:
+            try:
+                async with self._limit:
+                    response = await asyncio.wait_for(
+                        model.generate_content_async(contents),
+                        timeout=timeout or self.timeout,
+                    )
+                telemetry.record_tokens(_model_name(model), getattr(response, "usage_metadata", None))
+                return response
+            except RETRYABLE_ERRORS as e:
+                attempt = await self._backoff(model, attempt, e)
+
+    async def generate_text(self, model, contents, timeout=None):
+        response = await self.generate(model, contents, timeout)
+        return response.text.strip()
+
+    async def stream_text(self, model, contents):
+        """
+        Yield text chunks from a streaming generation as they arrive.
+
+        Retries only happen before the first chunk, and `timeout` applies to the wait for each
+        chunk. Closing the generator early (e.g. when the client disconnects) cancels the
+        underlying call so it stops using quota.
+        """
+        async with self._limit:
+            attempt = 0
+            while True:
+                try:
+                    response = await asyncio.wait_for(
+                        model.generate_content_async(contents, stream=True),
+                        timeout=self.timeout,
+                    )
+                    break
+                except RETRYABLE_ERRORS as e:
+                    attempt = await self._backoff(model, attempt, e)
+
+            chunks = response.__aiter__()
+            usage = None
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(anext(chunks), timeout=self.timeout)
+                    except StopAsyncIteration:
+                        return
+                    # Usage is cumulative; the last chunk carries the totals
+                    usage = getattr(chunk, "usage_metadata", None) or usage
+                    if chunk.parts:
+                        yield chunk.text
+            finally:
+                telemetry.record_tokens(_model_name(model), usage)
+                _cancel_stream(response)
+
+    async def _backoff(self, model, attempt, error):
+        """Sleep before retry number `attempt + 1`, or re-raise `error` once retries are used up."""
+        if attempt >= self.max_retries:
+            raise error
+        telemetry.MODEL_RETRIES.inc(model=_model_name(model), error=error.__class__.__name__)
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        print(f"Model call failed ({error.__class__.__name__}), retry {attempt + 1} in {delay:.1f}s")
+        await asyncio.sleep(delay)
+        return attempt + 1
+
+def _model_name(model):
+    return getattr(model, "model_name", model.__class__.__name__).removeprefix("models/")
+
+def _cancel_stream(response):
+    # The SDK has no public way to abort a stream; cancel the underlying gRPC call if we can reach it
+    cancel = getattr(getattr(response, "_iterator", None), "cancel", None)
+    if callable(cancel):
+        try:
+            cancel()
+        except Exception as e:
+            print(f"Error cancelling model stream: {e}")
@@ -0,0 +1,174 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Query parameters that never change page content
+TRACKING_PARAMS = ("utm_", "gclid", "fbclid", "msclkid", "mc_cid", "mc_eid")
+
+def normalize_url(url):
+    """
+    Normalize a URL so that trivially different links to the same page share a cache entry.
+
+    Lowercases the scheme and host, drops default ports, fragments and tracking parameters,
+    sorts the remaining query parameters and removes a trailing slash from the path.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and (scheme, parts.port) not in (("http", 80), ("https", 443)):
+        host = f"{host}:{parts.port}"
+    path = parts.path or "/"
+    if len(path) > 1:
+        path = path.rstrip("/")
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith(TRACKING_PARAMS)
+    )
+    return urlunsplit((scheme, host, path, urlencode(query), ""))
+
+def cache_key(url):
+    return hashlib.sha256(normalize_url(url).encode("utf-8")).hexdigest()
+
+class CachedPage:
+    def __init__(self, text, etag=None, last_modified=None, stored_at=None):
+        self.text = text
+        self.etag = etag
+        self.last_modified = last_modified
+        self.stored_at = stored_at if stored_at is not None else time.time()
+
+    def age(self):
+        return time.time() - self.stored_at
+
+    def can_revalidate(self):
+        return bool(self.etag or self.last_modified)
+
+class PageCache:
+    """
+    Two-tier cache of extracted page text keyed by normalized URL.
+
+    The memory tier is a bounded LRU; the optional SQLite tier at `db_path` survives restarts
+    and can be shared by several uvicorn workers. Entries younger than `ttl` are served as-is.
+    Older entries are kept for another `revalidate_ttl` seconds so they can be revalidated
+    with ETag/Last-Modified instead of re-downloaded, after which they are dropped.
+    """
+
+    def __init__(self, max_entries=256, ttl=24 * 3600, revalidate_ttl=7 * 24 * 3600, db_path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.revalidate_ttl = revalidate_ttl
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.counters = {"hits": 0, "disk_hits": 0, "misses": 0, "stale": 0, "revalidated": 0}
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=5)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                "key TEXT PRIMARY KEY, url TEXT, text TEXT, etag TEXT, last_modified TEXT, stored_at REAL)"
+            )
+            self._db.commit()
+
+    def get(self, url):
+        """
+        Look up a page.
+
+        Returns:
+            tuple: (CachedPage, fresh) where fresh is False when the entry needs revalidation,
+            or (None, False) on a miss.
+        """
+        key = cache_key(url)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+            if entry is None or entry.age() > self.ttl:
+                # Another worker may have refreshed the page in the shared disk tier
+                stored = self._load(key)
+                if stored is not None and (entry is None or stored.stored_at > entry.stored_at):
+                    entry = stored
+                    self._remember(key, entry)
+                    self.counters["disk_hits"] += 1
+
+            if entry is None or entry.age() > self.ttl + self.revalidate_ttl:
+                if entry is not None:
+                    self._forget(key)
+                self.counters["misses"] += 1
+                return None, False
+            if entry.age() > self.ttl:
+                self.counters["stale"] += 1
+                return entry, False
+            self.counters["hits"] += 1
+            return entry, True
+
+    def put(self, url, text, etag=None, last_modified=None):
+        if not text:
+            return
+        key = cache_key(url)
+        entry = CachedPage(text, etag, last_modified)
+        with self._lock:
+            self._remember(key, entry)
+            self._store(key, url, entry)
+
+    def mark_revalidated(self, url, entry):
+        """Restart the TTL of an entry the origin confirmed is unchanged (HTTP 304)."""
+        self.counters["revalidated"] += 1
+        self.put(url, entry.text, entry.etag, entry.last_modified)
+
+    def stats(self):
+        lookups = self.counters["hits"] + self.counters["stale"] + self.counters["misses"]
+        return {
+            **self.counters,
+            "entries": len(self._memory),
+            "hit_rate": self.counters["hits"] / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _forget(self, key):
+        self._memory.pop(key, None)
+        if self._db is None:
+            return
+        try:
+            self._db.execute("DELETE FROM pages WHERE key = ?", (key,))
+            self._db.commit()
+        except sqlite3.Error as e:
+            print(f"Error deleting from page cache: {e}")
+
+    def _load(self, key):
+        if self._db is None:
+            return None
+        try:
+            row = self._db.execute(
+                "SELECT text, etag, last_modified, stored_at FROM pages WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            # e.g. "database is locked" by another worker; treat it as a miss
+            print(f"Error reading page cache: {e}")
+            return None
+        return CachedPage(*row) if row else None
+
+    def _store(self, key, url, entry):
+        if self._db is None:
+            return
+        try:
+            self._db.execute(
+                "INSERT OR REPLACE INTO pages (key, url, text, etag, last_modified, stored_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, normalize_url(url), entry.text, entry.etag, entry.last_modified, entry.stored_at),
+            )
+            self._db.commit()
+        except sqlite3.Error as e:
+            print(f"Error writing page cache: {e}")
@@ -1,40 +1,360 @@
-import time
 import asyncio
+import queue
+import threading
+import time
 import concurrent.futures
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+import httpx
 from selenium import webdriver
+from selenium.common.exceptions import TimeoutException, WebDriverException
 from selenium.webdriver.chrome.options import Options
-from bs4 import BeautifulSoup
+from selenium.webdriver.support.ui import WebDriverWait
+from html_parsing import extract_main_text
+from page_cache import normalize_url
+import telemetry
 
-def synchronous_fetch(url):
-    driver = None
-    try:
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+)
+
+# Phrases that show up on pages which render their real content with JavaScript
+JS_REQUIRED_HINTS = ("enable javascript", "javascript is disabled", "javascript is required")
+
+def extract_text(page_source):
+    """Return the main readable text of a page, using the fastest installed HTML parser."""
+    return extract_main_text(page_source)
+
+class DriverPool:
+    """
+    A thread-safe pool of headless Chrome drivers shared by every fallback fetch.
+
+    Drivers are created lazily up to `size`, reused across URLs and quit after `max_uses`
+    page loads or as soon as one raises a WebDriverException.
+    """
+
+    def __init__(self, size=2, max_uses=50, ready_timeout=10, min_text_chars=500):
+        self.size = size
+        self.max_uses = max_uses
+        self.ready_timeout = ready_timeout
+        self.min_text_chars = min_text_chars
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._closed = False
+
+    def _create(self):
         options = Options()
         options.add_argument('--headless')
         options.add_argument('--disable-gpu')
         driver = webdriver.Chrome(options=options)
-        driver.get(url)
-        time.sleep(4)  # Wait for the page to load
-        page_source = driver.page_source
-        soup = BeautifulSoup(page_source, 'html.parser')
-        text_content = soup.find('body').get_text(separator=' ', strip=True)
-        return text_content
+        driver.set_page_load_timeout(self.ready_timeout * 2)
+        return driver
+
+    @contextmanager
+    def driver(self):
+        self._slots.acquire()
+        try:
+            try:
+                driver, uses = self._idle.get_nowait()
+            except queue.Empty:
+                driver, uses = self._create(), 0
+            reusable = True
+            try:
+                yield driver
+            except WebDriverException:
+                reusable = False
+                raise
+            finally:
+                uses += 1
+                if reusable and uses < self.max_uses and not self._closed:
+                    self._idle.put((driver, uses))
+                else:
+                    self._quit(driver)
+        finally:
+            self._slots.release()
+
+    def fetch(self, url):
+        """
+        Load a page and wait for its scripts to render the content instead of sleeping a fixed time.
+
+        driver.get() already returns after the load event, so this waits until the body holds
+        at least `min_text_chars` of text without a "JavaScript required" notice. Whatever has
+        rendered by `ready_timeout` is returned.
+        """
+        with self.driver() as driver:
+            driver.get(url)
+            try:
+                WebDriverWait(driver, self.ready_timeout).until(self._content_rendered)
+            except TimeoutException:
+                print(f"Timed out waiting for {url} to render, using the page as loaded")
+            return driver.page_source
+
+    def _content_rendered(self, driver):
+        text = driver.execute_script("return document.body ? document.body.innerText : ''") or ""
+        if len(text) < self.min_text_chars:
+            return False
+        return not any(hint in text[:2000].lower() for hint in JS_REQUIRED_HINTS)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                driver, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._quit(driver)
+
+    def _quit(self, driver):
+        try:
+            driver.quit()
+        except Exception as e:
+            print(f"Error quitting driver: {e}")
+
+class ExtractionEngine:
+    """
+    Fetches page text over a pooled async HTTP client, falling back to a shared pool of
+    headless drivers only for pages that need JavaScript to render their content.
+
+    Args:
+        max_concurrency (int): Pages fetched at once across all hosts.
+        per_host_concurrency (int): Pages fetched at once from a single host.
+        driver_pool_size (int): Headless drivers kept for the JavaScript fallback.
+        http_timeout (float): Seconds allowed for a fast-path fetch.
+        min_text_chars (int): Shortest fast-path text accepted before falling back to a driver.
+        cache (PageCache): Optional cache of extracted text consulted before fetching.
+    """
+
+    def __init__(self, max_concurrency=10, per_host_concurrency=2, driver_pool_size=2,
+                 http_timeout=10.0, min_text_chars=500, cache=None):
+        self.cache = cache
+        self.max_concurrency = max_concurrency
+        self.per_host_concurrency = per_host_concurrency
+        self.min_text_chars = min_text_chars
+        self._client = httpx.AsyncClient(
+            headers={"User-Agent": USER_AGENT},
+            follow_redirects=True,
+            timeout=http_timeout,
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+        )
+        self._drivers = DriverPool(size=driver_pool_size, min_text_chars=min_text_chars)
+        self._driver_executor = concurrent.futures.ThreadPoolExecutor(max_workers=driver_pool_size)
+        self._global_limit = asyncio.Semaphore(max_concurrency)
+        self._host_limits = {}
+
+    def _host_limit(self, url):
+        host = urlsplit(url).hostname or ""
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.per_host_concurrency)
+        return self._host_limits[host]
+
+    async def _fetch_fast(self, url, cached=None):
+        """
+        Fetch a page over HTTP, revalidating `cached` with its validators when given.
+
+        Returns:
+            tuple: (text, validators) where text is None if the page should be rendered by a
+            driver instead, and validators holds the response's ETag/Last-Modified headers.
+        """
+        headers = {}
+        if cached is not None:
+            if cached.etag:
+                headers["If-None-Match"] = cached.etag
+            if cached.last_modified:
+                headers["If-Modified-Since"] = cached.last_modified
+        try:
+            response = await self._client.get(url, headers=headers)
+        except Exception as e:
+            # Includes httpx.InvalidURL, which is not an httpx.HTTPError
+            print(f"Fast fetch failed for {url}: {e}")
+            return None, {}
+        validators = {
+            "etag": response.headers.get("etag"),
+            "last_modified": response.headers.get("last-modified"),
+        }
+        if response.status_code == 304 and cached is not None:
+            return cached.text, validators
+        if response.status_code >= 400:
+            print(f"Fast fetch got HTTP {response.status_code} for {url}")
+            return None, {}
+        if "html" not in response.headers.get("content-type", "html"):
+            return "", {}
+        try:
+            text = await asyncio.to_thread(extract_text, response.text)
+        except Exception as e:
+            print(f"Error extracting text from {url}: {e}")
+            return None, {}
+        if len(text) < self.min_text_chars or any(hint in text[:2000].lower() for hint in JS_REQUIRED_HINTS):
+            return None, {}
+        return text, validators
+
+    async def _fetch_rendered(self, url):
+        loop = asyncio.get_running_loop()
+        try:
+            page_source = await loop.run_in_executor(self._driver_executor, self._drivers.fetch, url)
+            return await asyncio.to_thread(extract_text, page_source)
+        except Exception as e:
+            print(f"Error: {e}")
+            return ""
+
+    async def get_page_text_content(self, url):
+        with telemetry.span("page_fetch", host=urlsplit(url).hostname or "") as span:
+            text = await self._get_page_text_content(url, span)
+            span.set(chars=len(text))
+            if not text:
+                span.status = "empty"
+            return text
+
+    async def _get_page_text_content(self, url, span):
+        cached = None
+        if self.cache is not None:
+            # The cache may query its shared SQLite tier, so keep it off the event loop
+            cached, fresh = await asyncio.to_thread(self.cache.get, url)
+            if fresh:
+                span.set(source="cache")
+                return cached.text
+            if cached is not None and not cached.can_revalidate():
+                cached = None
+
+        queued = time.perf_counter()
+        async with self._global_limit, self._host_limit(url):
+            # Time spent waiting for a global or per-host slot, a common cause of slow pages
+            span.set(queued_ms=round((time.perf_counter() - queued) * 1000, 1))
+            text, validators = await self._fetch_fast(url, cached)
+            if cached is not None and text is cached.text:
+                await asyncio.to_thread(self.cache.mark_revalidated, url, cached)
+                span.set(source="revalidated")
+                return text
+            if text is None:
+                print(f"Falling back to headless browser for {url}")
+                span.set(source="browser")
+                text = await self._fetch_rendered(url)
+            else:
+                span.set(source="http")
+
+        if self.cache is not None:
+            await asyncio.to_thread(self.cache.put, url, text, **validators)
+        return text
+
+    async def scrape_multiple_urls(self, urls):
+        return await asyncio.gather(*(self.get_page_text_content(url) for url in urls))
+
+    async def close(self):
+        if self.cache is not None:
+            self.cache.close()
+        await self._client.aclose()
+        self._driver_executor.shutdown(wait=False, cancel_futures=True)
+        await asyncio.to_thread(self._drivers.close)
+
+class PagePrefetcher:
+    """
+    Starts page fetches as soon as URLs are known, before it is decided which pages are needed.
+
+    Fetches are started with `start` (e.g. for the top search results while links are still
+    being selected), narrowed down with `keep_only` once the wanted links are known, and
+    collected in completion order with `next_completed`. Each fetch has its own deadline,
+    after which it counts as failed.
+
+    Args:
+        engine (ExtractionEngine): Engine used for fetching; the shared engine by default.
+        deadline (float): Seconds allowed per page, measured from when its fetch started.
+    """
+
+    def __init__(self, engine=None, deadline=15.0):
+        self._engine = engine or get_engine()
+        self.deadline = deadline
+        self._tasks = {}  # normalized URL -> task
+        self._completed = asyncio.Queue()
+        self._wanted = {}  # normalized URL -> URL as requested
+        self._collected = set()
+
+    def start(self, url):
+        key = self._key(url)
+        if key is not None and key not in self._tasks:
+            self._tasks[key] = asyncio.ensure_future(self._fetch(key, url))
+
+    async def _fetch(self, key, url):
+        try:
+            text = await asyncio.wait_for(self._engine.get_page_text_content(url), self.deadline)
+        except asyncio.TimeoutError:
+            print(f"Page missed its {self.deadline}s deadline: {url}")
+            text = ""
+        except Exception as e:
+            # Every wanted page must be reported, or next_completed would wait for it forever
+            print(f"Error fetching {url}: {e}")
+            text = ""
+        self._completed.put_nowait((key, text))
+
+    def keep_only(self, urls):
+        """
+        Cancel fetches for pages not in `urls` and make sure every page in `urls` is being fetched.
+        Links that aren't valid http(s) URLs are ignored.
+        """
+        self._wanted = {}
+        for url in urls:
+            key = self._key(url)
+            if key is not None:
+                self._wanted[key] = url
+        for key, task in self._tasks.items():
+            if key not in self._wanted:
+                task.cancel()
+        for url in self._wanted.values():
+            self.start(url)
+
+    @staticmethod
+    def _key(url):
+        """The normalized URL, or None if `url` is not a usable http(s) link (e.g. from model output)."""
+        if not url or not url.startswith("http"):
+            return None
+        try:
+            return normalize_url(url)
+        except ValueError:
+            print(f"Skipping malformed link: {url}")
+            return None
+
+    def remaining(self):
+        """Number of wanted pages not yet returned by next_completed."""
+        return len(self._wanted.keys() - self._collected)
+
+    async def next_completed(self):
+        """Wait for the next wanted page to finish, returning (url, text). Safe to cancel."""
+        while True:
+            key, text = await self._completed.get()
+            if key in self._wanted and key not in self._collected:
+                self._collected.add(key)
+                return self._wanted[key], text
+
+    def cancel(self):
+        for task in self._tasks.values():
+            task.cancel()
+
+# Set by the app at startup; a default engine is created on first use otherwise
+_engine = None
+
+def set_engine(engine):
+    global _engine
+    _engine = engine
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        _engine = ExtractionEngine()
+    return _engine
+
+def synchronous_fetch(url):
+    """Render a page with a pooled headless driver and return its text."""
+    try:
+        return extract_text(get_engine()._drivers.fetch(url))
     except Exception as e:
         print(f"Error: {e}")
         return ""
-    finally:
-        if driver:
-            driver.quit()
 
 async def get_page_text_content(url):
-    return await asyncio.to_thread(synchronous_fetch, url)
+    return await get_engine().get_page_text_content(url)
 
-async def scrape_multiple_urls(urls, thread_count=5):
-    """Scrape multiple URLs concurrently using multithreading with a custom thread count."""
-    loop = asyncio.get_running_loop()
-    with concurrent.futures.ThreadPoolExecutor(max_workers=thread_count) as executor:
-        tasks = [loop.run_in_executor(executor, synchronous_fetch, url) for url in urls]
-        results = await asyncio.gather(*tasks)
-    return results
+async def scrape_multiple_urls(urls):
+    """Scrape multiple URLs concurrently, using the async fast path and falling back to headless drivers."""
+    return await get_engine().scrape_multiple_urls(urls)
 
 if __name__ == "__main__":
     async def main():
@@ -44,4 +364,5 @@ if __name__ == "__main__":
             print(f"Text content of {url}:\n{text[:500]}...")  # Print first 500 characters
         else:
             print(f"Could not retrieve text content from {url}")
+        await get_engine().close()
     asyncio.run(main())
@@ -0,0 +1,208 @@
+import asyncio
+import json
+import sqlite3
+import sys
+import threading
+from abc import ABC, abstractmethod
+from collections import Counter
+from pathlib import Path
+
+import google_search
+from context_builder import tokenize
+from page_cache import normalize_url
+
+SUFFIXES = ("ing", "es", "ed", "s")
+
+def _stem(word):
+    # Close enough to the index's porter stemmer to count "stings" as covering "sting"
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+class SearchBackend(ABC):
+    """
+    Source of web search results for the analyze pipeline.
+
+    `search` returns a list of {title, link, blurb} dictionaries, best first.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    async def search(self, query):
+        pass
+
+    def close(self):
+        pass
+
+class BrowserSearchBackend(SearchBackend):
+    """Live Google results scraped with a headless browser, through the search cache and browser pool."""
+
+    name = "browser"
+
+    async def search(self, query):
+        return await google_search.google_search(query)
+
+class LocalIndexBackend(SearchBackend):
+    """
+    Full-text index of a curated set of medical pages, stored in SQLite FTS5.
+
+    Pages are ranked with BM25, weighting title matches above body matches. A page is only
+    returned when it contains at least `min_coverage` of the query's terms, so a single common
+    word like "skin" doesn't pull in unrelated pages.
+
+    Args:
+        db_path (str): The index database, created if missing.
+        max_results (int): Results returned per query.
+        min_coverage (float): Fraction of query terms a page must contain.
+    """
+
+    name = "local"
+
+    def __init__(self, db_path, max_results=10, min_coverage=0.5):
+        self.max_results = max_results
+        self.min_coverage = min_coverage
+        self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=5)
+        self._db.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS pages USING fts5("
+            "url UNINDEXED, title, body, tokenize='porter unicode61')"
+        )
+        self._db.commit()
+        self._lock = threading.Lock()
+
+    def add_page(self, url, title, text):
+        with self._lock:
+            self._db.execute("DELETE FROM pages WHERE url = ?", (url,))
+            self._db.execute("INSERT INTO pages (url, title, body) VALUES (?, ?, ?)", (url, title, text))
+            self._db.commit()
+
+    def count(self):
+        with self._lock:
+            return self._db.execute("SELECT count(*) FROM pages").fetchone()[0]
+
+    async def search(self, query):
+        return await asyncio.to_thread(self.search_sync, query)
+
+    def search_sync(self, query):
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        # Terms sharing a stem count once towards coverage
+        groups = {}
+        for term in terms:
+            groups.setdefault(_stem(term), []).append(term)
+        match = " OR ".join(f'"{term}"' for term in terms)
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT rowid, url, title, snippet(pages, 2, '', '', '...', 32) FROM pages "
+                "WHERE pages MATCH ? ORDER BY bm25(pages, 0.0, 5.0, 1.0) LIMIT ?",
+                (match, self.max_results * 3),
+            ).fetchall()
+            # Coverage comes from one index lookup per term group, never from re-reading page bodies
+            covered = Counter()
+            if rows:
+                placeholders = ", ".join("?" for _ in rows)
+                for group in groups.values():
+                    for (rowid,) in self._db.execute(
+                        f"SELECT rowid FROM pages WHERE pages MATCH ? AND rowid IN ({placeholders})",
+                        (" OR ".join(f'"{term}"' for term in group), *(row[0] for row in rows)),
+                    ):
+                        covered[rowid] += 1
+
+        results = []
+        for rowid, url, title, blurb in rows:
+            if covered[rowid] < self.min_coverage * len(groups):
+                continue
+            results.append({"title": title, "link": url, "blurb": blurb})
+            if len(results) >= self.max_results:
+                break
+        return results
+
+    def close(self):
+        self._db.close()
+
+class TieredSearchBackend(SearchBackend):
+    """
+    Consult the local index first and only fall back to live search when it has fewer than
+    `min_results` results. Live results are appended after the local ones, without duplicates;
+    if live search fails, whatever the local index found is returned instead.
+    """
+
+    name = "tiered"
+
+    def __init__(self, local, live, min_results=5):
+        self.local = local
+        self.live = live
+        self.min_results = min_results
+        self.counters = {"local": 0, "live": 0}
+
+    async def search(self, query):
+        results = await self.local.search(query)
+        if len(results) >= self.min_results:
+            self.counters["local"] += 1
+            return results
+        self.counters["live"] += 1
+        try:
+            live_results = await self.live.search(query)
+        except Exception as e:
+            # A few local hits beat a busy or failed live search
+            if not results:
+                raise
+            print(f"Live search failed, returning {len(results)} local results: {e}")
+            return results
+        seen = {normalize_url(result["link"]) for result in results}
+        for result in live_results:
+            key = normalize_url(result["link"])
+            if key not in seen:
+                seen.add(key)
+                results.append(result)
+        return results
+
+    def close(self):
+        self.local.close()
+        self.live.close()
+
+def create_search_backend(backend="browser", index_path="search_index.db", min_local_results=5):
+    if backend == "browser":
+        return BrowserSearchBackend()
+    if backend == "local":
+        return LocalIndexBackend(index_path)
+    if backend == "tiered":
+        return TieredSearchBackend(LocalIndexBackend(index_path), BrowserSearchBackend(), min_local_results)
+    raise ValueError(f"Unknown search backend: {backend}")
+
+def _pages_from_html(directory):
+    from html_parsing import extract_main_text, make_soup
+
+    for path in sorted(Path(directory).glob("*.htm*")):
+        html = path.read_text(encoding="utf-8", errors="replace")
+        soup = make_soup(html)
+        canonical = soup.select_one('link[rel="canonical"][href], meta[property="og:url"][content]')
+        if canonical is None:
+            print(f"Skipping {path.name}: no canonical URL")
+            continue
+        url = canonical.get("href") or canonical.get("content")
+        title = soup.title.get_text(strip=True) if soup.title else url
+        yield url, title, extract_main_text(html)
+
+def _pages_from_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                page = json.loads(line)
+                yield page["url"], page.get("title", page["url"]), page["text"]
+
+# Build or extend an index:
+#   python search_backends.py search_index.db pages.jsonl saved_pages/
+# JSONL lines hold {"url", "title", "text"}; saved HTML pages need a canonical link or og:url.
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        sys.exit("usage: python search_backends.py INDEX_DB (PAGES.jsonl | HTML_DIR)...")
+    index = LocalIndexBackend(sys.argv[1])
+    for source in sys.argv[2:]:
+        pages = _pages_from_html(source) if Path(source).is_dir() else _pages_from_jsonl(source)
+        for url, title, text in pages:
+            index.add_page(url, title, text)
+    print(f"{sys.argv[1]} holds {index.count()} pages")
+    index.close()
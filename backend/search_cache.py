@@ -0,0 +1,95 @@
+import asyncio
+import re
+import time
+from collections import OrderedDict
+
+def normalize_query(query):
+    """
+    Reduce a search query to a canonical form so that queries differing only in case,
+    punctuation, quoting or word order map to the same key.
+    """
+    words = re.findall(r"\w+", query.lower())
+    return " ".join(sorted(set(words)))
+
+class SearchCache:
+    """
+    LRU cache of parsed search results keyed on the normalized query, with a TTL.
+
+    Concurrent lookups of the same normalized query share one in-flight fetch, so N identical
+    requests arriving together trigger a single search. The fetch is cancelled once every caller
+    waiting on it has been cancelled. Empty result lists are not cached, since they usually mean
+    the search failed.
+    """
+
+    def __init__(self, max_entries=512, ttl=6 * 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._waiters = {}
+        self.counters = {"hits": 0, "misses": 0, "coalesced": 0}
+
+    async def get_or_fetch(self, query, fetch):
+        """
+        Return cached results for `query`, or await `fetch(query)` and cache its results.
+
+        Args:
+            query (str): The search query, as sent to the search engine.
+            fetch (callable): Coroutine function performing the actual search.
+
+        Returns:
+            list: The list of {title, link, blurb} dictionaries.
+        """
+        key = normalize_query(query)
+        entry = self._entries.get(key)
+        if entry is not None:
+            stored_at, results = entry
+            if time.time() - stored_at <= self.ttl:
+                self._entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return results
+            del self._entries[key]
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.counters["coalesced"] += 1
+        else:
+            self.counters["misses"] += 1
+            task = asyncio.ensure_future(fetch(query))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        # Shield so one cancelled caller doesn't cancel the search for everyone else
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._waiters[key] == 1 and not task.done():
+                task.cancel()
+                # Its done-callback runs later; a caller arriving before then must not join a cancelled search
+                if self._in_flight.get(key) is task:
+                    del self._in_flight[key]
+            raise
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+
+    def stats(self):
+        lookups = self.counters["hits"] + self.counters["misses"] + self.counters["coalesced"]
+        return {
+            **self.counters,
+            "entries": len(self._entries),
+            "hit_rate": (self.counters["hits"] + self.counters["coalesced"]) / lookups if lookups else 0.0,
+        }
+
+    def _finish(self, key, task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if task.cancelled() or task.exception() is not None:
+            return
+        results = task.result()
+        if results:
+            self._entries[key] = (time.time(), results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
@@ -0,0 +1,130 @@
+from urllib.parse import parse_qs, urljoin, urlsplit
+
+from html_parsing import make_soup
+from page_cache import normalize_url
+
+# Elements wrapping one organic result, across the desktop, mobile and basic-HTML layouts
+RESULT_CONTAINER_CLASSES = {"g", "MjjYud", "tF2Cxc", "N54PNb", "Gx5Zad", "xpd"}
+# Snippet elements, most specific first; Google rotates these class names regularly
+BLURB_SELECTORS = [
+    "div.VwiC3b",
+    "[data-sncf]",
+    "[style*='-webkit-line-clamp']",
+    "span.aCOpRe",
+    "div.IsZvec",
+    "div.BNeawe.s3v9rd",
+]
+# Title elements for layouts that don't use <h3>
+TITLE_SELECTORS = "h3, div[role='heading'], div.vvjwJb"
+# Sponsored results and answer boxes whose links are not organic results
+EXCLUDED_SECTIONS = {"tads", "bottomads", "tvcap"}
+EXCLUDED_CLASSES = {"related-question-pair", "uEierd", "commercial-unit-desktop-top"}
+REDIRECT_PATHS = ("/url", "/interstitial", "/imgres", "/aclk")
+MAX_CONTAINER_DEPTH = 8
+
+def unwrap_link(href, base="https://www.google.com"):
+    """
+    Turn a result href into the destination URL.
+
+    Google redirect links (/url?q=..., /url?url=...) are unwrapped; links back into Google
+    itself, such as related searches or cached copies, and malformed URLs return None.
+    """
+    if not href:
+        return None
+    try:
+        url = urljoin(base, href.strip())
+        parts = urlsplit(url)
+        parts.port  # raises on a non-numeric or out-of-range port
+    except ValueError:
+        return None
+    host = (parts.hostname or "").lower()
+    if _is_google_host(host):
+        if parts.path not in REDIRECT_PATHS:
+            return None
+        params = parse_qs(parts.query)
+        target = (params.get("q") or params.get("url") or params.get("imgrefurl") or [None])[0]
+        if not target:
+            return None
+        return unwrap_link(target, base)
+    if parts.scheme not in ("http", "https") or not host:
+        return None
+    if host.endswith("googleusercontent.com"):
+        return None
+    return url
+
+def _is_google_host(host):
+    return host == "google.com" or host.startswith("google.") or ".google." in host or host.endswith(".google.com")
+
+def _classes(tag):
+    return set(tag.get("class") or [])
+
+def _in_excluded_section(tag):
+    for parent in tag.parents:
+        if parent.get("id") in EXCLUDED_SECTIONS or _classes(parent) & EXCLUDED_CLASSES:
+            return True
+        if parent.has_attr("data-text-ad"):
+            return True
+    return False
+
+def _result_container(anchor):
+    node = anchor
+    for _ in range(MAX_CONTAINER_DEPTH):
+        parent = node.parent
+        if parent is None or parent.name in ("body", "[document]"):
+            break
+        node = parent
+        if _classes(node) & RESULT_CONTAINER_CLASSES or node.has_attr("data-hveid"):
+            return node
+    return node
+
+def _text(tag):
+    return " ".join(tag.get_text(" ", strip=True).split())
+
+def _blurb(container, anchor):
+    for selector in BLURB_SELECTORS:
+        element = container.select_one(selector)
+        if element is not None and anchor not in element.parents:
+            text = _text(element)
+            if text:
+                return text
+    # Unknown layout: the longest block of text outside the title link is almost always the snippet
+    best = ""
+    for element in container.find_all(["div", "span"]):
+        if element is anchor or anchor in element.parents or element.find("a") is not None:
+            continue
+        text = _text(element)
+        if len(text) > len(best):
+            best = text
+    return best
+
+def parse_serp(html):
+    """
+    Extract organic results from a Google results page.
+
+    Results are found from their title links rather than a single container class, so the
+    desktop, mobile and basic-HTML layouts all parse. Ads and answer boxes are skipped,
+    redirect links are unwrapped and results pointing at the same page are kept once.
+
+    Args:
+        html (str): The results page source.
+
+    Returns:
+        list: A list of {title, link, blurb} dictionaries in page order.
+    """
+    soup = make_soup(html)
+    results = []
+    seen = set()
+    for anchor in soup.find_all("a", href=True):
+        title_element = anchor.select_one(TITLE_SELECTORS)
+        if title_element is None:
+            continue
+        link = unwrap_link(anchor["href"])
+        if link is None:
+            continue
+        key = normalize_url(link)
+        if key in seen or _in_excluded_section(anchor):
+            continue
+        seen.add(key)
+        title = _text(title_element)
+        results.append({"title": title, "link": link, "blurb": _blurb(_result_container(anchor), anchor)})
+    return results
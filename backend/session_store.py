@@ -0,0 +1,172 @@
+import json
+import secrets
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+
+class SessionStore(ABC):
+    """
+    Server-side storage for chat sessions created by /analyze.
+
+    A session holds the analysis `context` (description, diagnosis, links, page passages) and
+    the chat `history` as Gemini content dicts ({"role": ..., "parts": [...]}). Sessions expire
+    `ttl` seconds after they were last used.
+    """
+
+    def __init__(self, ttl=2 * 3600):
+        self.ttl = ttl
+
+    def create(self, context):
+        session_id = secrets.token_urlsafe(16)
+        self.save(session_id, {"context": context, "history": []})
+        return session_id
+
+    @abstractmethod
+    def get(self, session_id):
+        """Return the session dict, or None if it does not exist or has expired."""
+
+    @abstractmethod
+    def save(self, session_id, session):
+        pass
+
+    @abstractmethod
+    def append_exchange(self, session_id, user_turn, reply, max_turns):
+        """
+        Atomically add a user turn and the model's reply to a session's history, so overlapping
+        chat requests on one session each keep their exchange. Returns False if the session is gone.
+        """
+
+    @abstractmethod
+    def delete_expired(self):
+        pass
+
+    def close(self):
+        pass
+
+def trimmed_history(history, user_turn, reply, max_turns):
+    """
+    Append an exchange to `history`, keeping the first exchange (it holds the analysis context)
+    and the latest `max_turns` others.
+    """
+    history = history + [
+        {"role": "user", "parts": [user_turn]},
+        {"role": "model", "parts": [reply]},
+    ]
+    if len(history) > 2 + 2 * max_turns:
+        history = history[:2] + (history[-2 * max_turns:] if max_turns > 0 else [])
+    return history
+
+class InMemorySessionStore(SessionStore):
+    def __init__(self, ttl=2 * 3600, max_sessions=10000):
+        super().__init__(ttl)
+        self.max_sessions = max_sessions
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            if time.time() - entry[0] > self.ttl:
+                del self._sessions[session_id]
+                return None
+            return entry[1]
+
+    def save(self, session_id, session):
+        with self._lock:
+            self._save(session_id, session)
+
+    def append_exchange(self, session_id, user_turn, reply, max_turns):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None or time.time() - entry[0] > self.ttl:
+                return False
+            session = dict(entry[1], history=trimmed_history(entry[1]["history"], user_turn, reply, max_turns))
+            self._save(session_id, session)
+            return True
+
+    def _save(self, session_id, session):
+        self._sessions[session_id] = (time.time(), session)
+        if len(self._sessions) > self.max_sessions:
+            self._delete_expired()
+            # Still full: drop the least recently used sessions
+            for stale_id, _ in sorted(self._sessions.items(), key=lambda item: item[1][0])[
+                :len(self._sessions) - self.max_sessions
+            ]:
+                del self._sessions[stale_id]
+
+    def delete_expired(self):
+        with self._lock:
+            self._delete_expired()
+
+    def _delete_expired(self):
+        now = time.time()
+        for session_id in [sid for sid, (updated_at, _) in self._sessions.items() if now - updated_at > self.ttl]:
+            del self._sessions[session_id]
+
+class SQLiteSessionStore(SessionStore):
+    """Session store backed by SQLite, so sessions survive restarts and are shared between workers."""
+
+    def __init__(self, db_path, ttl=2 * 3600):
+        super().__init__(ttl)
+        self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=5)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, data TEXT, updated_at REAL)"
+        )
+        self._db.commit()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT data FROM sessions WHERE id = ? AND updated_at >= ?",
+                (session_id, time.time() - self.ttl),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, session_id, session):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sessions (id, data, updated_at) VALUES (?, ?, ?)",
+                (session_id, json.dumps(session), time.time()),
+            )
+            self._db.commit()
+
+    def append_exchange(self, session_id, user_turn, reply, max_turns):
+        with self._lock:
+            # BEGIN IMMEDIATE takes the write lock before reading, so other worker processes wait
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT data FROM sessions WHERE id = ? AND updated_at >= ?",
+                    (session_id, time.time() - self.ttl),
+                ).fetchone()
+                if row is None:
+                    return False
+                session = json.loads(row[0])
+                session["history"] = trimmed_history(session["history"], user_turn, reply, max_turns)
+                self._db.execute(
+                    "UPDATE sessions SET data = ?, updated_at = ? WHERE id = ?",
+                    (json.dumps(session), time.time(), session_id),
+                )
+                return True
+            finally:
+                self._db.commit()
+
+    def delete_expired(self):
+        with self._lock:
+            self._db.execute("DELETE FROM sessions WHERE updated_at < ?", (time.time() - self.ttl,))
+            self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+def create_session_store(backend="memory", db_path="sessions.db", ttl=2 * 3600, max_sessions=10000):
+    if backend == "sqlite":
+        return SQLiteSessionStore(db_path, ttl=ttl)
+    if backend == "memory":
+        return InMemorySessionStore(ttl=ttl, max_sessions=max_sessions)
+    raise ValueError(f"Unknown session store backend: {backend}")
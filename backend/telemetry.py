@@ -0,0 +1,244 @@
+import asyncio
+import contextvars
+import json
+import secrets
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# OpenTelemetry is optional; spans are only exported when an SDK is configured,
+# e.g. by running the app under `opentelemetry-instrument`
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:
+    otel_trace = None
+
+_tracer = otel_trace.get_tracer(__name__) if otel_trace is not None else None
+
+# Seconds; spans range from a cache lookup to a slow model call
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(dict(zip(self.labels, key)))} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}  # label values -> [bucket counts..., count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                labels = dict(zip(self.labels, key))
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': bound})} {count}")
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {series[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {series[-2]}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {series[-1]}")
+        return lines
+
+REQUEST_SECONDS = Histogram("http_request_seconds", "Time to serve a request, including streamed bodies.",
+                            ("method", "route", "status"))
+STAGE_SECONDS = Histogram("pipeline_stage_seconds", "Time spent in each pipeline stage.", ("stage", "status"))
+MODEL_TOKENS = Counter("model_tokens_total", "Tokens sent to and generated by the model.", ("model", "kind"))
+MODEL_RETRIES = Counter("model_retries_total", "Model calls retried after a retryable error.", ("model", "error"))
+
+_metrics = [REQUEST_SECONDS, STAGE_SECONDS, MODEL_TOKENS, MODEL_RETRIES]
+_stats_sources = {}
+
+def register_stats(prefix, stats):
+    """
+    Export the numeric values of `stats()` as gauges named `<prefix>_<key>` on every scrape.
+
+    Used for the caches and pools, which already keep their own counters. Pass None to
+    unregister.
+    """
+    if stats is None:
+        _stats_sources.pop(prefix, None)
+    else:
+        _stats_sources[prefix] = stats
+
+def render_metrics():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for prefix, stats in list(_stats_sources.items()):
+        try:
+            values = stats() or {}
+        except Exception as e:
+            print(f"Error collecting {prefix} stats: {e}")
+            continue
+        for key, value in values.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                lines.append(f"# TYPE {prefix}_{key} gauge")
+                lines.append(f"{prefix}_{key} {value}")
+    return "\n".join(lines) + "\n"
+
+class RequestTrace:
+    """Spans and token counts recorded while serving one request."""
+
+    def __init__(self, method, path):
+        self.id = secrets.token_hex(8)
+        self.method = method
+        self.path = path
+        self.started = time.perf_counter()
+        self.spans = []
+        self.tokens = {"prompt": 0, "response": 0}
+
+    def as_dict(self, status, duration):
+        return {
+            "trace_id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": status,
+            "duration_ms": round(duration * 1000, 1),
+            "tokens": self.tokens,
+            "spans": self.spans,
+        }
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+class Span:
+    def __init__(self, stage, attributes):
+        self.stage = stage
+        self.attributes = attributes
+        self.status = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+@contextmanager
+def span(stage, **attributes):
+    """
+    Time a pipeline stage, recording it in the request's trace, the stage histogram and, when
+    OpenTelemetry is installed, as an OTel span. The status is "ok", "error" or "cancelled"
+    unless the body sets `span.status` itself.
+
+    Don't hold a span open across a `yield` of an async generator; wrap the awaited call instead.
+    """
+    record = Span(stage, attributes)
+    started = time.perf_counter()
+    trace = _current_trace.get()
+    status = "ok"
+    with _tracer.start_as_current_span(stage) if _tracer is not None else nullcontext() as otel_span:
+        try:
+            yield record
+        except asyncio.CancelledError:
+            status = "cancelled"
+            raise
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            status = record.status or status
+            STAGE_SECONDS.observe(duration, stage=stage, status=status)
+            if trace is not None:
+                trace.spans.append({
+                    "stage": stage,
+                    "start_ms": round((started - trace.started) * 1000, 1),
+                    "duration_ms": round(duration * 1000, 1),
+                    "status": status,
+                    **record.attributes,
+                })
+            if otel_span is not None:
+                otel_span.set_attribute("status", status)
+                for key, value in record.attributes.items():
+                    if isinstance(value, (str, bool, int, float)):
+                        otel_span.set_attribute(key, value)
+
+async def traced(stage, awaitable, **attributes):
+    """Await `awaitable` inside a span, e.g. for work started with asyncio.ensure_future."""
+    with span(stage, **attributes):
+        return await awaitable
+
+def record_tokens(model, usage):
+    """Count prompt and response tokens from a response's usage_metadata."""
+    if usage is None:
+        return
+    prompt = getattr(usage, "prompt_token_count", 0) or 0
+    response = getattr(usage, "candidates_token_count", 0) or 0
+    MODEL_TOKENS.inc(prompt, model=model, kind="prompt")
+    MODEL_TOKENS.inc(response, model=model, kind="response")
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.tokens["prompt"] += prompt
+        trace.tokens["response"] += response
+
+class TracingMiddleware:
+    """
+    ASGI middleware that starts a RequestTrace per request and records its latency once the
+    response, including a streamed body, has been sent. Requests that recorded spans are logged
+    as one JSON line.
+    """
+
+    def __init__(self, app, skip_paths=("/metrics",)):
+        self.app = app
+        self.skip_paths = skip_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace(scope["method"], scope["path"])
+        token = _current_trace.set(trace)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            root = _tracer.start_as_current_span(f"{scope['method']} {scope['path']}") if _tracer is not None else nullcontext()
+            with root:
+                await self.app(scope, receive, send_with_status)
+        finally:
+            _current_trace.reset(token)
+            duration = time.perf_counter() - trace.started
+            # Label by route template rather than raw path to keep the series count bounded
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_SECONDS.observe(duration, method=scope["method"], route=route, status=status)
+            if trace.spans:
+                print(json.dumps({"trace": trace.as_dict(status, duration)}))
@@ -23,6 +23,7 @@ type DiagnosisContext = {
   search_query: string;
   relevant_links: string[];
   page_contents: Record<string, string>;
+  session_id?: string;
 };
 
 export default function HomeScreen() {
@@ -132,7 +133,8 @@ export default function HomeScreen() {
         diagnosis: responseData.diagnosis || '',
         search_query: responseData.search_query || '',
         relevant_links: responseData.relevant_links || [],
-        page_contents: responseData.page_contents || {}
+        page_contents: responseData.page_contents || {},
+        session_id: responseData.session_id
       };
 
     } catch (error) {
@@ -152,7 +154,8 @@ export default function HomeScreen() {
           diagnosis,
           search_query,
           relevant_links,
-          page_contents
+          page_contents,
+          session_id
         } = analysisResult;
 
         // Store the context for future chat messages
@@ -161,7 +164,8 @@ export default function HomeScreen() {
           diagnosis,
           search_query,
           relevant_links,
-          page_contents
+          page_contents,
+          session_id
         });
 
         setInConversation(true);
@@ -192,23 +196,32 @@ export default function HomeScreen() {
     setUserInput('');
 
     try {
-      const response = await fetch(`${API_URL}/chat`, {
+      const postChat = (body: object) => fetch(`${API_URL}/chat`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
           'Accept': 'application/json',
         },
-        body: JSON.stringify({
-          message: userInput,
-          context: {
-            description: messageContext?.description || '',
-            diagnosis: messageContext?.diagnosis || '',
-            search_query: messageContext?.search_query || '',
-            relevant_links: messageContext?.relevant_links || [],
-            page_contents: messageContext?.page_contents || {}
-          }
-        })
+        body: JSON.stringify(body)
       });
+      const withContext = {
+        message: userInput,
+        context: {
+          description: messageContext?.description || '',
+          diagnosis: messageContext?.diagnosis || '',
+          search_query: messageContext?.search_query || '',
+          relevant_links: messageContext?.relevant_links || [],
+          page_contents: messageContext?.page_contents || {}
+        }
+      };
+
+      // The server keeps the context for the session; only resend it if the session expired
+      let response = messageContext?.session_id
+        ? await postChat({ message: userInput, session_id: messageContext.session_id })
+        : await postChat(withContext);
+      if (response.status === 404 && messageContext?.session_id) {
+        response = await postChat(withContext);
+      }
 
       if (!response.ok) {
         throw new Error(`Error: ${response.status}`);